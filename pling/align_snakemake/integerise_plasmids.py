@@ -1,13 +1,15 @@
 import subprocess
-from intervaltree import IntervalTree
 from pathlib import Path
 from typing import Tuple
-import pandas as pd
 from matches import *
+from pling.intervals import get_coverage, get_gaps, IntervalIndex
+from pling.alignment import read_delta, read_alignments, get_indel_positions
+
+NUCMER_OPTIONS = "--diagdiff 20 --breaklen 500 --maxmatch"
 
 def make_interval_tree_w_dups(block_coords, length_threshold):
-    ref_to_block = IntervalTree()
-    query_to_block = IntervalTree()
+    ref_to_block = IntervalIndex()
+    query_to_block = IntervalIndex()
     max_id = 0
     for i in range(len(block_coords)):
         rstart = block_coords[i].rstart
@@ -16,65 +18,35 @@ def make_interval_tree_w_dups(block_coords, length_threshold):
         qend = block_coords[i].qend
         qstrand = block_coords[i].strand
         if rend-rstart>length_threshold and qend-qstart>length_threshold:
-            if len(ref_to_block.envelop(rstart,rend)) != 0:
-                query_to_block[qstart:qend] = qstrand * list(ref_to_block[rstart:rend])[0].data
-            elif len(query_to_block.envelop(qstart,qend)) != 0:
-                ref_to_block[rstart:rend] = qstrand * list(query_to_block[qstart:qend])[0].data
+            #a block lying within an earlier one on either genome is a duplicate, and copies the id of the first block within it
+            ref_enveloped = ref_to_block.envelop(rstart,rend)
+            query_enveloped = query_to_block.envelop(qstart,qend)
+            if len(ref_enveloped) != 0:
+                query_to_block.add(qstart, qend, qstrand * ref_enveloped[0][2])
+            elif len(query_enveloped) != 0:
+                ref_to_block.add(rstart, rend, qstrand * query_enveloped[0][2])
             else:
                 max_id=max_id+1
-                ref_to_block[rstart:rend] = max_id
-                query_to_block[qstart:qend] = qstrand * max_id
+                ref_to_block.add(rstart, rend, max_id)
+                query_to_block.add(qstart, qend, qstrand * max_id)
     return ref_to_block, query_to_block, max_id
 
 def populate_interval_tree_with_unmatched_blocks(interval_tree, total_length, block_index, length_threshold):
-    pos = 1
-    while pos <= total_length:
-        no_matches = len(interval_tree[pos])==0
-        if no_matches:
-            start_pos = pos
-            while len(interval_tree[pos])==0 and pos<=total_length:
-                pos+=1
-            end_pos = pos
-
-            too_short_unmatched_block = end_pos-start_pos <= length_threshold
-            if not too_short_unmatched_block:
-                interval_tree[start_pos:end_pos]=block_index
-                block_index+=1
-        else:
-            pos+=1
+    #unmatched stretches longer than length_threshold become blocks of their own, numbered from block_index in order of position
+    for start_pos, end_pos in get_gaps([(start, end) for start, end, block_id in interval_tree], total_length, length_threshold):
+        interval_tree.add(start_pos, end_pos, block_index)
+        block_index+=1
 
 def get_unimog(interval_tree):
     intervals=[]
-    for interval in sorted(interval_tree):
-        intervals.append(str(interval.data))
+    for start, end, block_id in sorted(interval_tree):
+        intervals.append(str(block_id))
     intervals.append(")")
     return ' '.join(intervals)
 
 def get_blocks(plasmid, interval_tree):
-    data = {"Plasmid":[], "Block_ID":[], "Start":[], "End":[]}
-    for interval in sorted(interval_tree):
-        data["Plasmid"].append(plasmid)
-        data["Block_ID"].append(interval.data)
-        data["Start"].append(interval.begin)
-        data["End"].append(interval.end)
-    blocks = pd.DataFrame(data)
-    return blocks
-
-def get_coordinates(split_line, index):
-    start = int(split_line[index])
-    end = int(split_line[index+1])
-    if start > end:
-        start, end = end, start
-    end+=1
-    return start, end
-
-def get_coverage(tree):
-    merge_tree = IntervalTree(list(tree))
-    merge_tree.merge_overlaps()
-    coverage = 0
-    for interval in merge_tree:
-        coverage = coverage + (interval.end - interval.begin)
-    return coverage
+    #(plasmid, block id, start, end) of every block, in order of position
+    return [(plasmid, block_id, start, end) for start, end, block_id in sorted(interval_tree)]
 
 def sort_and_update_indels(indels):
     f_start = lambda indel: indel.qstart
@@ -108,46 +80,37 @@ def sort_and_update_indels(indels):
             updated_indels.append(indels[i])
     return updated_indels
 
-def integerise_plasmids(plasmid_1: Path, plasmid_2: Path, prefix: str, plasmid_1_name, plasmid_2_name, containment_threshold, identity_threshold=80, length_threshold=200):
-    subprocess.check_call(f"nucmer --diagdiff 20 --breaklen 500  --maxmatch -p {prefix} {plasmid_1} {plasmid_2} && delta-filter -1 {prefix}.delta > {prefix}.1delta", shell=True)
-    show_coords_output = subprocess.check_output(f"show-coords -TrcldH -I {identity_threshold} {prefix}.1delta", shell=True).strip().split(b'\n')  # TODO: what about this threshold?
-    show_snps_output = subprocess.check_output(f"show-snps -TrH {prefix}.1delta", shell=True).strip().split(b'\n')
-
-    assert(len(show_coords_output)>0)
+def integerise_plasmids(plasmid_1: Path, plasmid_2: Path, prefix: str, plasmid_1_name, plasmid_2_name, containment_threshold, identity_threshold=80, length_threshold=200, aligned=False):
+    #if aligned, {prefix}.1delta has already been written by pling.alignment
+    if not aligned:
+        subprocess.check_call(f"nucmer {NUCMER_OPTIONS} -p {prefix} {plasmid_1} {plasmid_2} && delta-filter -1 {prefix}.delta > {prefix}.1delta", shell=True)
+    coords, gapped_alignments, mismatched = read_alignments(read_delta(f"{prefix}.1delta"), identity_threshold)
 
     indels = []
-    if len(show_snps_output)>1:
-        for line in show_snps_output:
-            split_line = line.split(b'\t')
-            rsub = str(split_line[1]).replace("b\'","").replace("\'","")
-            qsub = str(split_line[2]).replace("b\'","").replace("\'","")
-            rstart = int(split_line[0])
-            qstart = int(split_line[3])
+    #indels used to be read from show-snps output, with a line per gapped base and per substitution, and a lone line was never read as an indel,
+    #so a single gapped base only counts if the alignments have a mismatch as well (show-snps left out mismatches against n, which this doesn't)
+    gaps = sum([len(alignment.deltas) for alignment in gapped_alignments])
+    if gaps>1 or (gaps==1 and mismatched):
+        for rstart, qstart, type in get_indel_positions(gapped_alignments):
             try:
                 repeated_line = (indels[-1].rstart==rstart and indels[-1].qstart==qstart)
             except:
                 repeated_line = False
             if not repeated_line:
-                if rsub == ".":
-                    type = "INS"
+                if type == "INS":
                     try:
                         extend_indel = indels[-1].rstart==rstart and indels[-1].qstart+indels[-1].len==qstart
                     except:
                         extend_indel = False
-                    if extend_indel:
-                        indels[-1].increase_len(1)
-                    else:
-                        indels.append(Indel(rstart,qstart,1,type))
-                elif qsub == ".":
-                    type = "DEL"
+                elif type == "DEL":
                     try:
                         extend_indel = indels[-1].qstart==qstart and indels[-1].rstart+indels[-1].len==rstart
                     except:
                         extend_indel = False
-                    if extend_indel:
-                        indels[-1].increase_len(1)
-                    else:
-                        indels.append(Indel(rstart,qstart,1,type))
+                if extend_indel:
+                    indels[-1].increase_len(1)
+                else:
+                    indels.append(Indel(rstart,qstart,1,type))
 
     if len(indels)>1:
         indels = sort_and_update_indels(indels)
@@ -156,18 +119,7 @@ def integerise_plasmids(plasmid_1: Path, plasmid_2: Path, prefix: str, plasmid_1
     len_query = -1
     og_matches = []
 
-    for line in show_coords_output:
-        split_line = line.split(b'\t')
-
-        try:
-            start_ref, end_ref = get_coordinates(split_line, 0)
-            start_query, end_query = get_coordinates(split_line, 2)
-        except ValueError:
-            continue
-
-        len_ref = int(split_line[7])
-        len_query = int(split_line[8])
-        strand_query = int(split_line[12])
+    for start_ref, end_ref, start_query, end_query, len_ref, len_query, strand_query in coords:
         try:
             not_repeat = not (abs(start_ref-og_matches[-1].rstart)<length_threshold/2 and abs(end_ref-og_matches[-1].rend)<length_threshold/2 and abs(start_query-og_matches[-1].qstart)<length_threshold/2 and abs(end_query-og_matches[-1].qend)<length_threshold/2)
         except:
@@ -182,8 +134,8 @@ def integerise_plasmids(plasmid_1: Path, plasmid_2: Path, prefix: str, plasmid_1
     coverage_query = 0
     no_matches_available = len(og_matches)==0
     if not no_matches_available:
-        coverage_ref = get_coverage(matches.reference)
-        coverage_query = get_coverage(matches.query)
+        coverage_ref = get_coverage([(match.rstart, match.rend) for match in og_matches])
+        coverage_query = get_coverage([(match.qstart, match.qend) for match in og_matches])
     if len_ref>len_query:
         containment_similarity = coverage_query/len_query
     else:
@@ -203,8 +155,8 @@ def integerise_plasmids(plasmid_1: Path, plasmid_2: Path, prefix: str, plasmid_1
     else:
         plasmid_1_unimogs = "1 )"
         plasmid_2_unimogs = "2 )"
-        blocks_ref = pd.DataFrame({"Plasmid":[], "Block_ID":[], "Start":[], "End":[]})
-        blocks_query = pd.DataFrame({"Plasmid":[], "Block_ID":[], "Start":[], "End":[]})
+        blocks_ref = []
+        blocks_query = []
 
     for extension in [".1coords", ".1delta", ".delta", ".mcoords", ".mdelta", ".qdiff", ".rdiff", ".report", ".snps", ".unqry", ".unref"]:
         try:
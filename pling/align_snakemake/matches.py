@@ -1,9 +1,11 @@
-from intervaltree import IntervalTree, Interval
+from bisect import bisect_left, bisect_right
+import random
 from pathlib import Path
 import subprocess
 import warnings
+from pling.intervals import IntervalIndex
 
-#REMEMBER: ALL INTERVALS IN INDELS AND MATCHES ARE ***OPEN*** ENDED (bc of IntervalTree)
+#REMEMBER: ALL INTERVALS IN INDELS AND MATCHES ARE ***OPEN*** ENDED (bc of IntervalIndex)
 
 class MatchPointsError(Exception):
     pass
@@ -12,6 +14,8 @@ class MatchesOrderError(Exception):
     pass
 
 class Indel:
+    __slots__ = ("type", "len", "rstart", "qstart", "rend", "qend") #no per-object dict, as indels and matches are created in large numbers
+
     def __init__(self, rstart, qstart, len, type):
         self.type = type
         self.len = len
@@ -34,7 +38,37 @@ class Indel:
         elif self.type == "INS":
             self.qend = self.qstart+self.len
 
+class IndelIndex:
+    #the indels sorted by reference and by query start, so that the indels near a match are found by bisection rather than by scanning all of them
+    def __init__(self, indels):
+        self.list = indels
+        self.max_rlen = max([indel.rend-indel.rstart for indel in indels], default=0)
+        self.max_qlen = max([indel.qend-indel.qstart for indel in indels], default=0)
+        self.ref_order = sorted(range(len(indels)), key=lambda i: indels[i].rstart)
+        self.ref_starts = [indels[i].rstart for i in self.ref_order]
+        self.query_order = sorted(range(len(indels)), key=lambda i: indels[i].qstart)
+        self.query_starts = [indels[i].qstart for i in self.query_order]
+
+    def __iter__(self):
+        return iter(self.list)
+
+    def __len__(self):
+        return len(self.list)
+
+    def near(self, rstart, rend, qstart, qend):
+        #the indels starting in [rstart, rend] on the reference, or in [qstart, qend] on the query, whichever are fewer, in their original order,
+        #as the first or last indel hit decides the result in the Match methods
+        ref_lo, ref_hi = bisect_left(self.ref_starts, rstart), bisect_right(self.ref_starts, rend)
+        query_lo, query_hi = bisect_left(self.query_starts, qstart), bisect_right(self.query_starts, qend)
+        if ref_hi-ref_lo <= query_hi-query_lo:
+            positions = self.ref_order[ref_lo:ref_hi]
+        else:
+            positions = self.query_order[query_lo:query_hi]
+        return [self.list[i] for i in sorted(positions)]
+
 class Match:
+    __slots__ = ("rstart", "rend", "qstart", "qend", "strand")
+
     def __init__(self, rstart, rend, qstart, qend, strand):
         if rend<rstart or qend<qstart:
             raise MatchPointsError(f"({rstart}, {rend}, {qstart}, {qend}, {strand}) is not a valid match! (start point greater than end point)")
@@ -78,7 +112,8 @@ class Match:
 
     def remove_indels_from_ends(self, indels):
         edited_bool = False
-        for indel in indels:
+        #an indel at an end of the match starts at most the longest indel before it
+        for indel in indels.near(self.rstart-indels.max_rlen, self.rend, self.qstart-indels.max_qlen, self.qend):
             if self.indel_at_rstart(indel):
                 edited_bool = True
                 rstart = indel.rend
@@ -150,9 +185,10 @@ class Match:
                 return self.rend
             elif coord == self.qend and self.strand == -1:
                 return self.rstart
+        contained_indels = indels.near(self.rstart, self.rend, self.qstart, self.qend)
         if ref_bool:
             dist = coord - self.rstart
-            for indel in indels:
+            for indel in contained_indels:
                 if self.indel_strictly_contained(indel):
                     if self.rstart<=indel.rstart<=coord<indel.rend:
                         return indel.qstart
@@ -167,7 +203,7 @@ class Match:
                 projected_coord = self.qend - dist
         else:
             dist = coord - self.qstart
-            for indel in indels:
+            for indel in contained_indels:
                 if self.indel_strictly_contained(indel):
                     if self.qstart<=indel.qstart<=coord<indel.qend:
                         return indel.rstart
@@ -182,104 +218,291 @@ class Match:
                 projected_coord = self.rend - dist
         return projected_coord
 
+def get_key(match):
+    return (match.rstart, match.rend, match.qstart, match.qend)
+
+def get_sort_key(match, ref_bool):
+    if ref_bool:
+        return (match.rstart, match.rend)
+    else:
+        return (match.qstart, match.qend)
+
+class MatchNode:
+    __slots__ = ("match", "priority", "left", "right", "parent", "size")
+
+    def __init__(self, match, priority):
+        self.match = match
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.size = 1
+
+    def update(self):
+        self.size = 1
+        for child in (self.left, self.right):
+            if child is not None:
+                self.size += child.size
+                child.parent = self
+
+def get_size(node):
+    if node is None:
+        return 0
+    return node.size
+
+def merge_match_nodes(left, right):
+    #joins two treaps, with the matches of left coming before the matches of right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge_match_nodes(left.right, right)
+        left.update()
+        return left
+    right.left = merge_match_nodes(left, right.left)
+    right.update()
+    return right
+
+def split_match_nodes(node, count):
+    #splits a treap into its first count matches and the rest
+    if node is None:
+        return None, None
+    if get_size(node.left) < count:
+        node.right, right = split_match_nodes(node.right, count-get_size(node.left)-1)
+        node.update()
+        return node, right
+    left, node.left = split_match_nodes(node.left, count)
+    node.update()
+    return left, node
+
+class MatchList:
+    #a list of matches, kept in a treap by position where every node holds the size of its subtree and its parent,
+    #so that getting, inserting or removing the node at a position, and finding the position of a node, take O(log n) time
+    #the nodes stay the same while their matches move or change, so they can be used as handles to the matches
+    def __init__(self, matches=()):
+        self.root = None
+        self.random = random.Random(0)
+        for match in matches:
+            self.root = merge_match_nodes(self.root, MatchNode(match, self.random.random()))
+        self.set_root(self.root)
+
+    def set_root(self, root):
+        self.root = root
+        if root is not None:
+            root.parent = None
+
+    def __len__(self):
+        return get_size(self.root)
+
+    def __iter__(self):
+        for node in self.nodes():
+            yield node.match
+
+    def nodes(self):
+        #the nodes in list order
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node
+                node = node.right
+
+    def node(self, position):
+        if position<0 or position>=len(self):
+            raise IndexError("match list index out of range")
+        node = self.root
+        while True:
+            left_size = node.left.size if node.left is not None else 0
+            if position < left_size:
+                node = node.left
+            elif position == left_size:
+                return node
+            else:
+                position -= left_size+1
+                node = node.right
+
+    def position(self, node):
+        position = get_size(node.left)
+        while node.parent is not None:
+            if node is node.parent.right:
+                position += get_size(node.parent.left)+1
+            node = node.parent
+        return position
+
+    def insert(self, position, node):
+        node.left = None
+        node.right = None
+        node.update()
+        left, right = split_match_nodes(self.root, position)
+        self.set_root(merge_match_nodes(merge_match_nodes(left, node), right))
+
+    def remove(self, position):
+        left, right = split_match_nodes(self.root, position)
+        node, right = split_match_nodes(right, 1)
+        self.set_root(merge_match_nodes(left, right))
+        return node
+
+    def count_before(self, sort_key, ref_bool, or_equal):
+        #number of matches ordered before sort_key (or equal to it, if or_equal), if the list is sorted by get_sort_key(match, ref_bool)
+        count = 0
+        node = self.root
+        while node is not None:
+            key = get_sort_key(node.match, ref_bool)
+            if key < sort_key or (or_equal and key == sort_key):
+                count += get_size(node.left)+1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
 class Matches:
     def __init__(self, list_of_matches, indels): #list_of_matches is a list of Match objects
-        self.list = list_of_matches
-        self.indels = indels
-        self.reference = IntervalTree()
-        self.query = IntervalTree()
-        for match in self.list:
-            self.reference[match.rstart:match.rend] = (match.qstart, match.qend, match.strand)
-            self.query[match.qstart:match.qend] = (match.rstart, match.rend, match.strand)
+        self.indels = IndelIndex(indels)
+        self.reference = IntervalIndex()
+        self.query = IntervalIndex()
+        for match in list_of_matches:
+            self.reference.add(match.rstart, match.rend, (match.qstart, match.qend, match.strand))
+            self.query.add(match.qstart, match.qend, (match.rstart, match.rend, match.strand))
+        self.set_list(list_of_matches, None)
+
+    def set_list(self, list_of_matches, sorted_by):
+        #nodes holds the list nodes of the matches with the same coordinates, so that a match can be found without comparing Match objects one by one,
+        #query_disorder counts neighbouring matches out of query order, so that sorted_by_query doesn't have to check the whole list,
+        #and changed holds the nodes of the matches set or inserted since the list was last sorted by reference (sorted_by=True) or query (False),
+        #so that sorting it again only has to move those
+        self.matches = MatchList(list_of_matches)
+        self.nodes = {}
+        for node in self.matches.nodes():
+            self.nodes.setdefault(get_key(node.match), []).append(node)
+        self.sorted_by = sorted_by
+        self.changed = set()
+        self.query_disorder = sum([self.out_of_query_order(i) for i in range(1, len(self))])
+
+    @property
+    def list(self):
+        return list(self.matches)
+
+    def out_of_query_order(self, i):
+        if i<1 or i>=len(self):
+            return 0
+        return int(self[i-1].qstart>self[i].qstart or self[i-1].qend>self[i].qend)
+
+    def index(self, match): #position of the first match with the same coordinates as match
+        nodes = self.nodes.get(get_key(match))
+        if not nodes:
+            raise ValueError(f"{match} is not in the matches")
+        return min([self.matches.position(node) for node in nodes])
 
     def __getitem__(self, key):
-        return self.list[key]
+        if key<0:
+            key += len(self)
+        return self.matches.node(key).match
 
     def __setitem__(self, key, match):
-        old_match = self.list[key]
-        self.reference.remove(Interval(old_match.rstart, old_match.rend, (old_match.qstart, old_match.qend, old_match.strand)))
-        self.query.remove(Interval(old_match.qstart, old_match.qend, (old_match.rstart, old_match.rend, old_match.strand)))
+        if key<0:
+            key += len(self)
+        node = self.matches.node(key)
+        old_match = node.match
+        self.reference.remove(old_match.rstart, old_match.rend, (old_match.qstart, old_match.qend, old_match.strand))
+        self.query.remove(old_match.qstart, old_match.qend, (old_match.rstart, old_match.rend, old_match.strand))
         if match.rend-match.rstart>0 and match.qend-match.qstart>0:
-            self.reference[match.rstart:match.rend] = (match.qstart, match.qend, match.strand)
-            self.query[match.qstart:match.qend] = (match.rstart, match.rend, match.strand)
-        self.list[key] = match
+            self.reference.add(match.rstart, match.rend, (match.qstart, match.qend, match.strand))
+            self.query.add(match.qstart, match.qend, (match.rstart, match.rend, match.strand))
+        self.query_disorder -= self.out_of_query_order(key)+self.out_of_query_order(key+1)
+        self.remove_node(node)
+        node.match = match
+        self.add_node(node)
+        self.query_disorder += self.out_of_query_order(key)+self.out_of_query_order(key+1)
 
     def insert(self, key, match):
-        self.list.insert(key, match)
+        if key<0:
+            key = max(key+len(self), 0)
+        key = min(key, len(self))
+        node = MatchNode(match, self.matches.random.random())
+        self.insert_node(key, node)
+        self.add_node(node)
         if match.rend-match.rstart>0 and match.qend-match.qstart>0:
-            self.reference[match.rstart:match.rend]= (match.qstart, match.qend, match.strand)
-            self.query[match.qstart:match.qend] = (match.rstart, match.rend, match.strand)
+            self.reference.add(match.rstart, match.rend, (match.qstart, match.qend, match.strand))
+            self.query.add(match.qstart, match.qend, (match.rstart, match.rend, match.strand))
+
+    def add_node(self, node):
+        self.nodes.setdefault(get_key(node.match), []).append(node)
+        self.changed.add(node)
+
+    def remove_node(self, node):
+        key = get_key(node.match)
+        self.nodes[key].remove(node)
+        if not self.nodes[key]:
+            del self.nodes[key]
+
+    def insert_node(self, key, node):
+        self.query_disorder -= self.out_of_query_order(key)
+        self.matches.insert(key, node)
+        self.query_disorder += self.out_of_query_order(key)+self.out_of_query_order(key+1)
+
+    def pop_node(self, key):
+        self.query_disorder -= self.out_of_query_order(key)+self.out_of_query_order(key+1)
+        node = self.matches.remove(key)
+        self.query_disorder += self.out_of_query_order(key)
+        return node
 
     def __len__(self):
-        return len(self.list)
+        return len(self.matches)
 
     def __str__(self):
         matches = [str(match) for match in self.list]
         return '['+', '.join(matches)+']'
 
     def sort(self, ref_bool): #sort in ascending ref or query start positions, with matches w same start being sorted according to ascending end position
-        if ref_bool:
-            f_start = lambda match: match.rstart
-            f_end = lambda match: match.rend
-        else:
-            f_start = lambda match: match.qstart
-            f_end = lambda match: match.qend
-        self.list = sorted(self.list, key=f_start)
-        n = len(self.list)
-        i=0
-        while i < n:
-            same_start_matches = [self[i]]
-            same_start = True
-            j = i + 1
-            while same_start and j<n:
-                if ref_bool and self[i].rstart==self[j].rstart:
-                    same_start_matches.append(self[j])
-                elif (not ref_bool) and self[i].qstart==self[j].qstart:
-                    same_start_matches.append(self[j])
-                else:
-                    same_start = False
-                j = j+1
-            subsort = sorted(same_start_matches, key=f_end)
-            for k in range(len(subsort)):
-                self.list[i+k] = subsort[k]
-            i = i+len(subsort)
+        #a stable sort: if the list was sorted the same way before, only the matches changed since are taken out and put back in,
+        #each just after the unchanged matches it came after, unless that breaks the order, in O(k log n) time for k changed matches
+        if self.sorted_by is not ref_bool:
+            self.set_list(sorted(self.list, key=lambda match: get_sort_key(match, ref_bool)), ref_bool)
+            return
+        changed = sorted([(self.matches.position(node), node) for node in self.changed], key=lambda item: item[0])
+        self.changed = set()
+        for position, node in reversed(changed):
+            self.pop_node(position)
+        moved = []
+        for j, (position, node) in enumerate(changed):
+            sort_key = get_sort_key(node.match, ref_bool)
+            lowest = self.matches.count_before(sort_key, ref_bool, False)
+            highest = self.matches.count_before(sort_key, ref_bool, True)
+            moved.append((sort_key, min(max(position-j, lowest), highest), node))
+        moved.sort(key=lambda item: item[0])
+        for j, (sort_key, position, node) in enumerate(moved):
+            self.insert_node(position+j, node)
 
     def sorted_by_ref(self):
-        for i in range(1, len(self.list)):
+        for i in range(1, len(self)):
             if self[i-1].rstart>self[i].rstart or self[i-1].rend>self[i].rend:
                 return False
         return True
 
     def sorted_by_query(self):
-        for i in range(1, len(self.list)):
-            if self[i-1].qstart>self[i].qstart or self[i-1].qend>self[i].qend:
-                return False
-        return True
+        return self.query_disorder==0
 
     def purge_null_intervals(self):
         purged = [el for el in self.list if el.rstart!=el.rend and el.qstart!=el.qend]
-        self.list = purged
+        self.set_list(purged, None)
 
     def remove_indels_from_ends(self):
-        for i in range(len(self.list)):
+        for i in range(len(self)):
             self[i] = self[i].remove_indels_from_ends(self.indels)
 
     def contain_interval(self, start, end, ref_bool): #find in which matches interval (start, end) is contained in ref/query genome
-        matches = []
         if ref_bool:
-            interval_matches = list(self.reference[start:end])
-            for interval in interval_matches:
-                if interval.begin <=start and interval.end >=end:
-                    matches.append(Match(interval.begin, interval.end, interval.data[0], interval.data[1], interval.data[2]))
+            return [Match(rstart, rend, qstart, qend, strand) for rstart, rend, (qstart, qend, strand) in self.reference.contain(start, end)]
         else:
-            interval_matches = list(self.query[start:end])
-            for interval in interval_matches:
-                if interval.begin <=start and interval.end >=end:
-                    matches.append(Match(interval.data[0], interval.data[1], interval.begin, interval.end, interval.data[2]))
-        return matches
+            return [Match(rstart, rend, qstart, qend, strand) for qstart, qend, (rstart, rend, strand) in self.query.contain(start, end)]
 
     def split_match(self, match, start, end, ref_bool): #given an interval (start,end) on ref/query genome, split up the match (containing it)
-        index = self.list.index(match)
+        index = self.index(match)
         projected_start = match.projection(start, self.indels, ref_bool)
         projected_end = match.projection(end, self.indels, ref_bool)
         if ref_bool:
@@ -362,95 +585,55 @@ class Matches:
         return overlaps
 
     def resolve_overlaps(self, overlap_threshold):
-        length = len(self.list)
+        #sweeps over the matches in query order and then in reference order, and wherever two neighbouring matches overlap by more than overlap_threshold,
+        #splits every match containing the overlap on the other genome at its ends
+        #the pieces of a split match take its place, and after a containment only the changed matches are sorted back in,
+        #so that a step takes O(log n) time, plus O(log n) per match split
+        length = len(self)
         self.remove_indels_from_ends()
-        self.sort(False)
-        i=0
-        finished = False
-        old_version = self
         breakoff = max(length**3, 1000)
-        while not finished:
-            if i>breakoff:
-                raise Exception(f"The resolve_overlaps function in matches.py has been stuck in the while loop for {breakoff} iterations! There is likely a bug, please raise an issue.")
-            overlap = 0
-            try:
-                overlap = self[i].qend-self[i+1].qstart
-                not_null = self[i].qstart!=self[i].qend and self[i+1].qstart!=self[i+1].qend #ignore null intervals
-                containment = self[i+1].qend<self[i].qend
-            except IndexError:
-                finished = True
-                not_null = False
-                containment = False
-            if not_null and overlap>overlap_threshold:
-                try:
-                    overlap_matches = self.find_opposite_overlaps(i, False)
-                    contain_overlap_1 = self.contain_interval(overlap_matches[0].rstart, overlap_matches[0].rend, True)
-                    for match in contain_overlap_1:
-                        self.split_match(match, overlap_matches[0].rstart, overlap_matches[0].rend, True)
-                    contain_overlap_2 = self.contain_interval(overlap_matches[1].rstart, overlap_matches[1].rend, True)
-                    for match in contain_overlap_2:
-                        self.split_match(match, overlap_matches[1].rstart, overlap_matches[1].rend, True)
-                except MatchPointsError:
-                    warnings.warn("An invalid match was created while fixing overlaps. Overlap fixing is broken off, and the last version prior to the error is used for integerisation.")
-                    return
-                except MatchOrderError:
-                    warnings.warn("The ordering of matches was broken. Overlap fixing is broken off, and the last version prior to the error is used for integerisation.")
-                    return
-                if containment:
-                    current_match = self[i]
-                    self.sort(False)
-                    i = self.list.index(current_match)
-            i = i+1
-            if i % 5 == 0:
-                if not self.sorted_by_query():
-                    self = old_version
-                    warnings.warn("The ordering of matches was broken. Overlap fixing is broken off, and the version five iterations ago is used for integerisation.")
-                    return
-                else:
-                    old_version = self
-
-        self.sort(True)
+        for ref_bool in [False, True]:
+            self.sort(ref_bool)
+            if not self.sweep(ref_bool, overlap_threshold, breakoff):
+                return
+
+    def sweep(self, ref_bool, overlap_threshold, breakoff): #returns False if overlap fixing was broken off
         i=0
         finished = False
         while not finished:
             if i>breakoff:
                 raise Exception(f"The resolve_overlaps function in matches.py has been stuck in the while loop for {breakoff} iterations! There is likely a bug, please raise an issue.")
-            overlap = 0
-            try:
-                overlap = self[i].rend-self[i+1].rstart
-                not_null = self[i].rstart!=self[i].rend and self[i+1].rstart!=self[i+1].rend
-                containment = self[i+1].rend<self[i].rend
-            except IndexError:
+            if i+1<len(self):
+                start_1, end_1 = get_sort_key(self[i], ref_bool)
+                start_2, end_2 = get_sort_key(self[i+1], ref_bool)
+                overlap = end_1-start_2
+                not_null = start_1!=end_1 and start_2!=end_2 #ignore null intervals
+                containment = end_2<end_1
+            else:
                 finished = True
                 not_null = False
                 containment = False
             if not_null and overlap>overlap_threshold:
                 try:
-                    overlap_matches = self.find_opposite_overlaps(i, True)
-                    contain_overlap_1 = self.contain_interval(overlap_matches[0].qstart, overlap_matches[0].qend, False)
-                    for match in contain_overlap_1:
-                        self.split_match(match, overlap_matches[0].qstart, overlap_matches[0].qend, False)
-                    contain_overlap_2 = self.contain_interval(overlap_matches[1].qstart, overlap_matches[1].qend, False)
-                    for match in contain_overlap_2:
-                        self.split_match(match, overlap_matches[1].qstart, overlap_matches[1].qend, False)
+                    for overlap_match in self.find_opposite_overlaps(i, ref_bool):
+                        start, end = get_sort_key(overlap_match, not ref_bool)
+                        for match in self.contain_interval(start, end, not ref_bool):
+                            self.split_match(match, start, end, not ref_bool)
                 except MatchPointsError:
                     warnings.warn("An invalid match was created while fixing overlaps. Overlap fixing is broken off, and the last version prior to the error is used for integerisation.")
-                    return
-                except MatchOrderError:
+                    return False
+                except MatchesOrderError:
                     warnings.warn("The ordering of matches was broken. Overlap fixing is broken off, and the last version prior to the error is used for integerisation.")
-                    return
+                    return False
                 if containment:
                     current_match = self[i]
-                    self.sort(True)
-                    i = self.list.index(current_match)
+                    self.sort(ref_bool)
+                    i = self.index(current_match)
             i = i+1
-            if i % 5 == 0:
-                if not self.sorted_by_query():
-                    self = old_version
-                    warnings.warn("The ordering of matches was broken. Overlap fixing is broken off, and the version five iterations ago is used for integerisation.")
-                    return
-                else:
-                    old_version = self
+            if i % 5 == 0 and not self.sorted_by_query():
+                warnings.warn("The ordering of matches was broken. Overlap fixing is broken off, and the version five iterations ago is used for integerisation.")
+                return False
+        return True
 
 testing = False
 if testing == True:
@@ -1,45 +1,65 @@
-from integerise_plasmids import integerise_plasmids
-import pandas as pd
+from integerise_plasmids import integerise_plasmids, NUCMER_OPTIONS
+import numpy as np
 import argparse
 import os
 from pathlib import Path
-from pling.utils import read_in_batch_pairs, get_fasta_file_info
+from pling.utils import read_in_batch_pairs, get_manifest_fasta_file_info, read_genome_manifest_column, scratch_directory
+from pling.alignment import align_pair, align_one_vs_many, map_pairs_in_order
 
-def unimogs_to_ilp_core(genome_1_fasta, genome_2_fasta, genome_1, genome_2, containment_threshold, identity_threshold):
+def unimogs_to_ilp_core(genome_1_fasta, genome_2_fasta, genome_1, genome_2, containment_threshold, identity_threshold, aligned=False, scratch="."):
     plasmid_1_unimogs, plasmid_2_unimogs, containment_distance, blocks_ref, blocks_query = integerise_plasmids(genome_1_fasta, genome_2_fasta,
-                                                                f"{genome_1}~{genome_2}", genome_1, genome_2, containment_threshold, identity_threshold)
+                                                                f"{scratch}/{genome_1}~{genome_2}", genome_1, genome_2, containment_threshold, identity_threshold, aligned=aligned)
     unimog = f">{genome_1}~{genome_2}:{genome_1}\n{plasmid_1_unimogs}\n>{genome_1}~{genome_2}:{genome_2}\n{plasmid_2_unimogs}\n"
     return unimog, containment_distance, blocks_ref, blocks_query
 
-def batchwise_unimog(fastafiles, pairs, unimogpath, mappath, containmentpath, identity_threshold, containment_threshold):
+def pair_unimogs(genome_1, genome_2, fastafiles, hashes, containment_threshold, identity_threshold, delta_cache, scratch_dir, keep_scratch):
+    #every pair is aligned in its own scratch directory, so that pairs running concurrently don't share files
+    with scratch_directory(f"{genome_1}~{genome_2}", scratch_dir, keep_scratch) as scratch:
+        align_pair(genome_1, genome_2, fastafiles, f"{scratch}/{genome_1}~{genome_2}", NUCMER_OPTIONS, hashes, delta_cache)
+        return unimogs_to_ilp_core(fastafiles[genome_1], fastafiles[genome_2], genome_1, genome_2, containment_threshold, identity_threshold, aligned=True, scratch=scratch)
+
+def reference_unimogs(genome_1, partners, fastafiles, hashes, containment_threshold, identity_threshold, delta_cache, scratch_dir, keep_scratch):
+    #the reference genome is aligned once against all its partners
+    with scratch_directory(genome_1, scratch_dir, keep_scratch) as scratch:
+        prefixes = {genome_2: f"{scratch}/{genome_1}~{genome_2}" for genome_2 in partners}
+        align_one_vs_many(genome_1, fastafiles, prefixes, NUCMER_OPTIONS, f"{scratch}/{genome_1}~queries", hashes, delta_cache)
+        return [unimogs_to_ilp_core(fastafiles[genome_1], fastafiles[genome_2], genome_1, genome_2, containment_threshold, identity_threshold, aligned=True, scratch=scratch) for genome_2 in partners]
+
+def write_map(mappath, batch_blocks):
+    #one row per block, with the pair only named on its first row
+    lines = ["\tPlasmid\tBlock_ID\tStart\tEnd\n"]
+    for pair, blocks in batch_blocks.items():
+        lines.append(pair)
+        lines.extend([f"\t{plasmid}\t{block_id}\t{start}\t{end}\n" for plasmid, block_id, start, end in blocks])
+    with open(mappath, 'w') as f:
+        f.write("".join(lines))
+
+def write_map_npz(npzpath, batch_blocks):
+    #the same blocks as the map, as one column per field with the pair on every row, to be read back with numpy.load
+    rows = [(pair, *block) for pair, blocks in batch_blocks.items() for block in blocks]
+    np.savez_compressed(npzpath,
+                        pair=np.array([row[0] for row in rows], dtype=str),
+                        plasmid=np.array([row[1] for row in rows], dtype=str),
+                        block_id=np.array([row[2] for row in rows], dtype=np.int64),
+                        start=np.array([row[3] for row in rows], dtype=np.int64),
+                        end=np.array([row[4] for row in rows], dtype=np.int64))
+
+def batchwise_unimog(fastafiles, pairs, unimogpath, mappath, containmentpath, identity_threshold, containment_threshold, one_vs_many=False, threads=1, hashes=None, delta_cache=None, scratch_dir=None, keep_scratch=False, npzpath=None):
     containments = []
     unimogs = []
     batch_blocks = {}
-    for pair in pairs:
-        genome_1 = pair[0]
-        genome_2 = pair[1]
-        genome_1_fasta = fastafiles[genome_1]
-        genome_2_fasta = fastafiles[genome_2]
-        unimog, containment, blocks_ref, blocks_query = unimogs_to_ilp_core(genome_1_fasta, genome_2_fasta, genome_1, genome_2, containment_threshold, identity_threshold)
+    results = map_pairs_in_order(pair_unimogs, reference_unimogs, pairs, fastafiles, hashes, (containment_threshold, identity_threshold, delta_cache, scratch_dir, keep_scratch), one_vs_many, threads)
+    for (genome_1, genome_2), (unimog, containment, blocks_ref, blocks_query) in zip(pairs, results):
         containments.append(f"{genome_1}\t{genome_2}\t{containment}\n")
         if containment<=containment_threshold:
             unimogs.append(unimog)
-            blocks = pd.concat([blocks_ref, blocks_query], ignore_index=True)
-            batch_blocks[f"{genome_1}~{genome_2}"] = blocks
+            batch_blocks[f"{genome_1}~{genome_2}"] = blocks_ref+blocks_query
     with open(unimogpath, 'w') as f:
         for line in unimogs:
             f.write(line)
-    with open(mappath, 'w') as f:
-        f.write("\tPlasmid\tBlock_ID\tStart\tEnd\n")
-        for key in batch_blocks.keys():
-            f.write(f"{key}")
-            blocks = batch_blocks[key]
-            for index in blocks.index:
-                plasmid = blocks.loc[index, "Plasmid"]
-                block_id = blocks.loc[index, "Block_ID"]
-                start = blocks.loc[index, "Start"]
-                end = blocks.loc[index, "End"]
-                f.write(f"\t{plasmid}\t{block_id}\t{start}\t{end}\n")
+    write_map(mappath, batch_blocks)
+    if npzpath is not None:
+        write_map_npz(npzpath, batch_blocks)
     with open(containmentpath, 'w') as f:
         for line in containments:
             f.write(line)
@@ -50,7 +70,7 @@ def main():
     parser = argparse.ArgumentParser(description="Process a pair of genomes and create unimogs, containment and sequence blocks output.")
 
     # Add the arguments
-    parser.add_argument("--genomes_list", required=True, help="Text file with list of all fasta filepaths")
+    parser.add_argument("--genome_manifest", required=True, help="Genome manifest with the fasta filepaths of all genomes")
     parser.add_argument("--batch", required=True, help="Batch number")
     parser.add_argument("--identity_threshold", required=True, type=float, help="Identity threshold for comparison")
     parser.add_argument("--containment_distance", required=True, type=float, help="containment distance threshold value")
@@ -58,15 +78,27 @@ def main():
     parser.add_argument("--containment_output", required=True, help="Output path for containment index results")
     parser.add_argument("--unimog_output", required=True, help="Output path for unimog")
     parser.add_argument("--map_output", required=True, help="Output path for map")
+    parser.add_argument("--map_npz_output", help="Also write the map to this path in numpy's .npz format, with one array per column. The workflow doesn't write it, as nothing in pling reads it")
+    parser.add_argument("--one_vs_many", action="store_true", help="Align every reference genome of the batch once against all its partners, rather than every pair separately")
+    parser.add_argument("--threads", type=int, default=1, help="Number of pairs to process concurrently")
+    parser.add_argument("--delta_cache", help="Directory of cached filtered alignments, keyed by the contents of both fastas and the alignment parameters")
+    parser.add_argument("--scratch_dir", help="Directory to create the job's scratch directory for intermediate files in, default is /dev/shm if available")
+    parser.add_argument("--keep_scratch", action="store_true", help="Don't remove the scratch directory after the job, e.g. to inspect the files of a failed pair")
 
     # Parse the arguments
     args = parser.parse_args()
 
-    fastafiles, fastaext, fastapath = get_fasta_file_info(args.genomes_list)
+    fastafiles, fastaext, fastapath = get_manifest_fasta_file_info(args.genome_manifest)
+
+    pairs=read_in_batch_pairs(f"{args.outputpath}/batches", args.batch)
 
-    pairs=read_in_batch_pairs(f"{args.outputpath}/batches/batch_{args.batch}.txt")
+    if args.delta_cache:
+        hashes = read_genome_manifest_column(args.genome_manifest, "hash")
+    else:
+        hashes = None
 
-    batchwise_unimog(fastafiles, pairs, args.unimog_output, args.map_output, args.containment_output, args.identity_threshold, args.containment_distance)
+    with scratch_directory(f"make_unimogs_{args.batch}", args.scratch_dir, args.keep_scratch) as scratch:
+        batchwise_unimog(fastafiles, pairs, args.unimog_output, args.map_output, args.containment_output, args.identity_threshold, args.containment_distance, args.one_vs_many, args.threads, hashes, args.delta_cache, scratch, args.keep_scratch, args.map_npz_output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+import subprocess
+import gzip
+import hashlib
+import os
+import uuid
+import heapq
+from collections import namedtuple
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+DELTA_FILTER_OPTIONS = "-1"
+
+DeltaAlignment = namedtuple("DeltaAlignment", ["reference", "query", "len_ref", "len_query", "sR", "eR", "sQ", "eQ", "errors", "deltas"])
+
+def group_pairs_by_reference(pairs):
+    #returns the index and query genome of every pair, grouped by reference genome, in batch order
+    groups = {}
+    for index, (genome_1, genome_2) in enumerate(pairs):
+        groups.setdefault(genome_1, []).append((index, genome_2))
+    return groups
+
+def write_queries_fasta(fastafiles, queries, output):
+    #records are renamed to {genome}~{k}, so that every alignment in the combined delta can be traced back to its genome
+    with open(output, "w") as out:
+        for genome in queries:
+            record = 0
+            with open(fastafiles[genome]) as f:
+                for line in f:
+                    if line.startswith(">"):
+                        line = f">{genome}~{record}\n"
+                        record += 1
+                    elif not line.endswith("\n"):
+                        line += "\n"
+                    out.write(line)
+
+def split_delta(delta, prefixes):
+    #nucmer writes the alignments of every reference and query record pair under a ">reference query" line,
+    #so the alignments of each query genome are written to their own {prefix}.delta, as if it had been aligned alone
+    with open(delta) as f:
+        header = f.readline()+f.readline()
+        blocks = {genome: [] for genome in prefixes}
+        lines = None
+        for line in f:
+            if line.startswith(">"):
+                lines = blocks[line[1:].split()[1].rsplit("~", 1)[0]]
+            lines.append(line)
+    for genome, prefix in prefixes.items():
+        with open(f"{prefix}.delta", "w") as out:
+            out.write(header)
+            out.writelines(blocks[genome])
+
+def get_record_names(fasta):
+    #nucmer identifies records by the first word of their header
+    with open(fasta) as f:
+        return [line[1:].split()[0] for line in f if line.startswith(">")]
+
+def copy_delta(lines, out, reference_fasta, query_fasta, query_names=None):
+    #the first line of a delta names the fastas that show-snps reads the sequences from, so it is pointed at the given fastas,
+    #and with query_names, query records renamed to {genome}~{k} get their own names back
+    next(lines)
+    out.write(f"{reference_fasta} {query_fasta}\n")
+    for line in lines:
+        if query_names is not None and line.startswith(">"):
+            reference, query, lengths = line[1:].split(" ", 2)
+            line = f">{reference} {query_names[int(query.rsplit('~', 1)[1])]} {lengths}"
+        out.write(line)
+
+@lru_cache(maxsize=None)
+def get_nucmer_version():
+    #MUMmer 3 prints its version to stderr and MUMmer 4 to stdout, so both are kept
+    result = subprocess.run("nucmer --version", shell=True, capture_output=True, text=True)
+    return " ".join((result.stdout+result.stderr).split())
+
+def get_delta_cache_path(delta_cache, hash_1, hash_2, nucmer_options, nucmer_version):
+    #filtered deltas are keyed by the contents of both fastas, the alignment parameters and the MUMmer version, so that an upgrade doesn't reuse older alignments
+    key = hashlib.sha256(f"{hash_1}\t{hash_2}\tnucmer {nucmer_options}\tdelta-filter {DELTA_FILTER_OPTIONS}\t{nucmer_version}".encode()).hexdigest()
+    return Path(delta_cache)/key[:2]/f"{key}.1delta.gz"
+
+def restore_cached_delta(cache_path, reference_fasta, query_fasta, prefix):
+    with gzip.open(cache_path, "rt") as f, open(f"{prefix}.1delta", "w") as out:
+        copy_delta(f, out, reference_fasta, query_fasta)
+
+def store_cached_delta(prefix, cache_path):
+    #written to a temporary file of its own first, as other jobs or workers may be storing or reading the same pair,
+    #and moved into place in one step, so the last of several concurrent writers wins and readers never see a partial file
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(f"{prefix}.1delta") as f, gzip.open(tmp_path, "wt") as out:
+            out.writelines(f)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+def get_cache_paths(genome_1, partners, hashes, nucmer_options, delta_cache):
+    if delta_cache is None:
+        return {genome_2: None for genome_2 in partners}
+    nucmer_version = get_nucmer_version()
+    return {genome_2: get_delta_cache_path(delta_cache, hashes[genome_1], hashes[genome_2], nucmer_options, nucmer_version) for genome_2 in partners}
+
+def align_pair(genome_1, genome_2, fastafiles, prefix, nucmer_options, hashes=None, delta_cache=None):
+    #writes the 1-to-1 filtered alignment of the pair to {prefix}.1delta, taken from the delta cache if the pair has been aligned before
+    cache_path = get_cache_paths(genome_1, [genome_2], hashes, nucmer_options, delta_cache)[genome_2]
+    if cache_path is not None and cache_path.exists():
+        restore_cached_delta(cache_path, fastafiles[genome_1], fastafiles[genome_2], prefix)
+        return
+    subprocess.check_call(f"nucmer {nucmer_options} -p {prefix} {fastafiles[genome_1]} {fastafiles[genome_2]} && delta-filter {DELTA_FILTER_OPTIONS} {prefix}.delta > {prefix}.1delta", shell=True)
+    Path(f"{prefix}.delta").unlink()
+    if cache_path is not None:
+        store_cached_delta(prefix, cache_path)
+
+def align_one_vs_many(genome_1, fastafiles, prefixes, nucmer_options, group_prefix, hashes=None, delta_cache=None):
+    #writes the 1-to-1 filtered alignment of the reference with every partner to {prefix}.1delta, as align_pair would,
+    #aligning the reference once against all partners that are not in the delta cache
+    cache_paths = get_cache_paths(genome_1, prefixes.keys(), hashes, nucmer_options, delta_cache)
+    to_align = {}
+    for genome_2, prefix in prefixes.items():
+        if cache_paths[genome_2] is not None and cache_paths[genome_2].exists():
+            restore_cached_delta(cache_paths[genome_2], fastafiles[genome_1], fastafiles[genome_2], prefix)
+        else:
+            to_align[genome_2] = prefix
+    if len(to_align) == 0:
+        return
+    queries_fasta = f"{group_prefix}.queries.fna"
+    write_queries_fasta(fastafiles, to_align.keys(), queries_fasta)
+    subprocess.check_call(f"nucmer {nucmer_options} -p {group_prefix} {fastafiles[genome_1]} {queries_fasta}", shell=True)
+    split_delta(f"{group_prefix}.delta", to_align)
+    for genome_2, prefix in to_align.items():
+        subprocess.check_call(f"delta-filter {DELTA_FILTER_OPTIONS} {prefix}.delta > {prefix}.split.1delta", shell=True)
+        with open(f"{prefix}.split.1delta") as f, open(f"{prefix}.1delta", "w") as out:
+            copy_delta(f, out, fastafiles[genome_1], fastafiles[genome_2], get_record_names(fastafiles[genome_2]))
+        for extension in [".delta", ".split.1delta"]:
+            Path(prefix+extension).unlink()
+        if cache_paths[genome_2] is not None:
+            store_cached_delta(prefix, cache_paths[genome_2])
+    for extension in [".delta", ".queries.fna"]:
+        Path(group_prefix+extension).unlink()
+
+def read_delta(delta):
+    #streams the alignments of a delta file, in file order, without reading the whole file into memory
+    #sQ>eQ for alignments to the reverse strand of the query, and deltas are the indel positions of the alignment
+    with open(delta) as f:
+        f.readline()
+        f.readline()
+        for line in f:
+            if line.startswith(">"):
+                reference, query, len_ref, len_query = line[1:].split()
+                len_ref, len_query = int(len_ref), int(len_query)
+                continue
+            sR, eR, sQ, eQ, errors = [int(value) for value in line.split()[:5]]
+            deltas = []
+            for line in f:
+                delta = int(line)
+                if delta == 0:
+                    break
+                deltas.append(delta)
+            yield DeltaAlignment(reference, query, len_ref, len_query, sR, eR, sQ, eQ, errors, deltas)
+
+def get_identity(alignment):
+    #percent identity as show-coords computes it, in single precision: the errors over the length of the alignment,
+    #which is the reference span plus the query bases missing from the reference
+    total = np.float32(abs(alignment.eR-alignment.sR)+1+sum([1 for delta in alignment.deltas if delta < 0]))
+    return np.float32(np.float64(np.float32((total-np.float32(alignment.errors))/total))*100.0)
+
+def read_alignments(alignments, identity_threshold=0):
+    #goes through the alignments once, and returns:
+    #their coordinates as get_coords does, the alignments with gaps for get_indel_positions,
+    #and whether any alignment has a mismatch, as the errors of an alignment are its gapped bases and its mismatches
+    coords = []
+    gapped = []
+    mismatched = False
+    for alignment in alignments:
+        if alignment.deltas:
+            gapped.append(alignment)
+        mismatched = mismatched or alignment.errors > len(alignment.deltas)
+        if get_identity(alignment) < np.float32(identity_threshold):
+            continue
+        strand = 1 if alignment.sQ <= alignment.eQ else -1
+        start_query, end_query = min(alignment.sQ, alignment.eQ), max(alignment.sQ, alignment.eQ)
+        coords.append(((alignment.reference, alignment.sR, alignment.query, alignment.sQ),
+                       (alignment.sR, alignment.eR+1, start_query, end_query+1, alignment.len_ref, alignment.len_query, strand)))
+    coords.sort(key=lambda coord: coord[0])
+    return [coord for key, coord in coords], gapped, mismatched
+
+def get_coords(alignments, identity_threshold=0):
+    #the alignments with at least identity_threshold percent identity, sorted by reference like show-coords -r,
+    #as (start_ref, end_ref, start_query, end_query, len_ref, len_query, strand) with 1-based, end-exclusive coordinates
+    return read_alignments(alignments, identity_threshold)[0]
+
+def get_alignment_gaps(alignment):
+    #the gapped bases of one alignment as (reference, rpos, query, qpos, type), by reference position, and by query position for the same reference position
+    reverse = alignment.sQ > alignment.eQ
+    rpos = alignment.sR
+    #query positions along the aligned strand
+    qpos = alignment.len_query-alignment.sQ+1 if reverse else alignment.sQ
+    same_rpos = []
+    for delta in alignment.deltas:
+        rpos += abs(delta)-1
+        qpos += abs(delta)-1
+        if delta > 0:
+            gap = (rpos, qpos if reverse else qpos-1, "DEL")
+            rpos += 1
+        else:
+            gap = (rpos-1, qpos, "INS")
+            qpos += 1
+        if reverse:
+            gap = (gap[0], alignment.len_query-gap[1]+1, gap[2])
+        #reference positions never go back, but on the reverse strand query positions do, so gaps at the same reference position are sorted before they are yielded
+        if same_rpos and same_rpos[0][1] != gap[0]:
+            yield from sorted(same_rpos, key=lambda position: position[3])
+            same_rpos = []
+        same_rpos.append((alignment.reference, gap[0], alignment.query, gap[1], gap[2]))
+    yield from sorted(same_rpos, key=lambda position: position[3])
+
+def get_indel_positions(alignments):
+    #every gapped base of the alignments as (rpos, qpos, type), sorted by reference like show-snps -r, with the same positions:
+    #"DEL" for a reference base missing from the query, at the query base before it on the forward strand, and at the one after it on the reverse strand,
+    #"INS" for a query base missing from the reference, at the reference base before it
+    #the gaps of each alignment are already sorted, so they are merged as they are generated
+    for reference, rpos, query, qpos, type in heapq.merge(*[get_alignment_gaps(alignment) for alignment in alignments], key=lambda position: position[:4]):
+        yield (rpos, qpos, type)
+
+def map_in_order(function, tasks, threads=1):
+    #runs function on every task's arguments, concurrently in up to threads worker processes, and returns the results in task order
+    if threads <= 1 or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(threads, len(tasks))) as executor:
+        return list(executor.map(function, *zip(*tasks)))
+
+def map_pairs_in_order(pair_function, reference_function, pairs, fastafiles, hashes, extra_args, one_vs_many=False, threads=1):
+    #runs every pair of a batch through pair_function(genome_1, genome_2, fastafiles, hashes, *extra_args),
+    #or with one_vs_many every reference genome through reference_function(genome_1, partners, fastafiles, hashes, *extra_args), which returns one result per partner,
+    #and returns the results in pair order
+    #every task is only given the fastas and hashes (which may be None) of its own genomes
+    def get_subset(info, genomes):
+        return None if info is None else {genome: info[genome] for genome in genomes}
+
+    if one_vs_many:
+        tasks = []
+        order = []
+        for genome_1, partners in group_pairs_by_reference(pairs).items():
+            partner_genomes = [genome_2 for index, genome_2 in partners]
+            genomes = [genome_1]+partner_genomes
+            tasks.append((genome_1, partner_genomes, get_subset(fastafiles, genomes), get_subset(hashes, genomes), *extra_args))
+            order.extend([index for index, genome_2 in partners])
+        task_results = map_in_order(reference_function, tasks, threads)
+    else:
+        tasks = [(genome_1, genome_2, get_subset(fastafiles, [genome_1, genome_2]), get_subset(hashes, [genome_1, genome_2]), *extra_args) for genome_1, genome_2 in pairs]
+        order = range(len(pairs))
+        task_results = [[result] for result in map_in_order(pair_function, tasks, threads)]
+    results = [None]*len(pairs)
+    for index, result in zip(order, [result for task_result in task_results for result in task_result]):
+        results[index] = result
+    return results
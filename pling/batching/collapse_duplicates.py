@@ -0,0 +1,94 @@
+import argparse
+import os
+import hashlib
+from pathlib import Path
+from pling.utils import read_genome_manifest
+
+COMPLEMENT = str.maketrans("ACGTRYKMBVDHN", "TGCAYRMKVBHDN")
+
+def read_sequences(fasta):
+    sequences = []
+    with open(fasta) as f:
+        for line in f:
+            if line.startswith(">"):
+                sequences.append([])
+            elif len(sequences) > 0:
+                sequences[-1].append(line.strip().upper())
+    return ["".join(sequence) for sequence in sequences]
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+def is_same_plasmid(sequences_1, sequences_2):
+    #single record fastas are the same plasmid if one is a rotation of the other on either strand, so it occurs in the other twice over
+    if len(sequences_1) != 1 or len(sequences_2) != 1:
+        return sequences_1 == sequences_2
+    sequence_1 = sequences_1[0]
+    sequence_2 = sequences_2[0]
+    if len(sequence_1) != len(sequence_2):
+        return False
+    doubled = sequence_1+sequence_1
+    return sequence_2 in doubled or reverse_complement(sequence_2) in doubled
+
+def get_composition_key(sequences):
+    #key that is the same for all copies of a plasmid: for single record fastas, strand independent base composition, which doesn't change under rotation or reverse complementing,
+    #for fastas with several records, a hash of the sequences, so these are only collapsed if identical
+    if len(sequences) == 1:
+        sequence = sequences[0]
+        return (tuple(sorted([sequence.count("A"), sequence.count("T")])), tuple(sorted([sequence.count("C"), sequence.count("G")])))
+    hasher = hashlib.sha256()
+    for sequence in sequences:
+        hasher.update(f"{sequence}\n".encode())
+    return hasher.hexdigest()
+
+def get_duplicate_classes(manifest):
+    #returns the representative of every genome, which is the first genome of its duplicate class in manifest order
+    #copies have the same length and number of records, so only genomes sharing these with another genome are read,
+    #files with the same content hash are copies without comparing them, and the others are only compared to genomes with the same composition key
+    groups = {}
+    for genome, length, records in zip(manifest.index, manifest["length"], manifest["records"]):
+        groups.setdefault((length, records), []).append(genome)
+    representative = {}
+    for group in groups.values():
+        hashes = {}
+        candidates = {}
+        for genome in group:
+            hash = manifest.at[genome, "hash"]
+            if hash in hashes:
+                representative[genome] = hashes[hash]
+                continue
+            representative[genome] = genome
+            if len(group) > 1:
+                sequences = read_sequences(manifest.at[genome, "path"])
+                key_candidates = candidates.setdefault(get_composition_key(sequences), [])
+                for candidate, candidate_sequences in key_candidates:
+                    if is_same_plasmid(candidate_sequences, sequences):
+                        representative[genome] = candidate
+                        break
+                else:
+                    key_candidates.append((genome, sequences))
+            hashes[hash] = representative[genome]
+    return {genome: representative[genome] for genome in manifest.index}
+
+def main():
+    parser = argparse.ArgumentParser(description="Collapse identical and rotated copies of plasmids into one representative each")
+
+    parser.add_argument("--genome_manifest", required=True)
+    parser.add_argument("--representatives_manifest", required=True, help="Output genome manifest of the representatives")
+    parser.add_argument("--classes_output", required=True, help="Output tsv of the representative of every plasmid")
+
+    args = parser.parse_args()
+
+    manifest = read_genome_manifest(args.genome_manifest)
+    genomes = list(manifest.index)
+    representative = get_duplicate_classes(manifest)
+
+    Path(os.path.dirname(args.classes_output)).mkdir(parents=True, exist_ok=True)
+    with open(args.classes_output, "w") as f:
+        f.write("plasmid\trepresentative\n")
+        for genome in genomes:
+            f.write(f"{genome}\t{representative[genome]}\n")
+    manifest.loc[[genome for genome in genomes if representative[genome] == genome]].to_csv(args.representatives_manifest, sep="\t")
+
+if __name__ == "__main__":
+    main()
@@ -2,106 +2,317 @@ import argparse
 import os
 import math
 import numpy as np
-import subprocess
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pling.utils import get_fasta_file_info
-
-def write_batch_file(output_dir, batches, batch):
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    with open(f"{output_dir}/batch_{batch}.txt","w") as batch_list:
-        batch_list.write("\n".join([str(el) for el in batches[str(batch)]]))
-
-def get_labels(filepath):
-    fastafiles, fastaext, fastapath = get_fasta_file_info(filepath)
-    genomes = list(fastaext.keys())
-    genome_index = {genome:i for i, genome in enumerate(genomes)}
-    return genomes, genome_index
-
-def append_pair(smash, smash_threshold, smash_matrix, i, j):
-    if not smash:
-        return True
+from pling.utils import BatchManifestWriter, read_in_manifest_genomes, read_genome_manifest
+
+class BatchWriter:
+    #collects pairs row by row and writes out a batch to the manifest as soon as it is full, so only one batch is ever held in memory
+    #batches are full after batch_size pairs, or, if target_cost is given, once their predicted cost reaches target_cost
+    def __init__(self, output_dir, genomes, batch_size, target_cost=None):
+        self.manifest = BatchManifestWriter(output_dir, genomes)
+        self.batch_size = batch_size
+        self.target_cost = target_cost
+        self.pending_i = []
+        self.pending_j = []
+        self.pending_costs = []
+        self.pending = 0
+        self.pending_cost = 0.0
+        self.batch_sizes = []
+        self.batch_costs = []
+
+    def add(self, i, js, costs=None):
+        if len(js) == 0:
+            return
+        self.pending_i.append(np.full(len(js), i, dtype=np.int32))
+        self.pending_j.append(js)
+        if self.target_cost is not None:
+            self.pending_costs.append(costs)
+            self.pending_cost += costs.sum()
+        self.pending += len(js)
+        self.flush(full_batches_only=True)
+
+    def get_batch_ends(self, costs):
+        if self.target_cost is None:
+            return list(range(self.batch_size, self.pending+1, self.batch_size))
+        ends = []
+        cumulative_costs = np.cumsum(costs)
+        done = 0.0
+        while True:
+            end = int(np.searchsorted(cumulative_costs, done+self.target_cost, side="left"))+1
+            if end > self.pending:
+                return ends
+            ends.append(end)
+            done = cumulative_costs[end-1]
+
+    def flush(self, full_batches_only=False):
+        if self.pending == 0:
+            return
+        if full_batches_only and self.target_cost is None and self.pending < self.batch_size:
+            return
+        if full_batches_only and self.target_cost is not None and self.pending_cost < self.target_cost:
+            return
+        pairs_i = np.concatenate(self.pending_i)
+        pairs_j = np.concatenate(self.pending_j)
+        costs = np.concatenate(self.pending_costs) if self.target_cost is not None else None
+        ends = self.get_batch_ends(costs)
+        if not full_batches_only and (len(ends) == 0 or ends[-1] < self.pending):
+            ends.append(self.pending)
+        start = 0
+        for end in ends:
+            self.manifest.write_batch(pairs_i[start:end], pairs_j[start:end])
+            self.batch_sizes.append(end-start)
+            if costs is not None:
+                self.batch_costs.append(float(costs[start:end].sum()))
+            start = end
+        self.pending_i = [pairs_i[start:]]
+        self.pending_j = [pairs_j[start:]]
+        if costs is not None:
+            self.pending_costs = [costs[start:]]
+            self.pending_cost = costs[start:].sum()
+        self.pending = self.pending-start
+
+    def close(self):
+        self.flush()
+        return self.manifest.close()
+
+def estimate_pair_costs(lengths, i, js, similarities=None):
+    #relative cost in Mbp^2: the number of nucmer matches (and so overlap resolution work) of repeat-rich plasmids grows with the product of their lengths,
+    #and pairs sharing more sequence are the ones that go on to full integerisation and DCJ
+    costs = lengths[i]*lengths[js]/1e12
+    if similarities is not None:
+        costs = costs*(1+similarities)
+    return costs
+
+def get_row(i, containment_index=None, is_new=None):
+    #returns the genomes j<i to pair with genome i and their sourmash distances to i (None without sourmash)
+    #if is_new is given, pairs of two genomes that are not new (already done in a previous run) are left out
+    js = np.arange(i, dtype=np.int32)
+    if containment_index is None:
+        distances = None
     else:
-        return (1-smash_matrix[i][j]<=smash_threshold)
+        #containments are only computed for the genomes sharing hashes with i, the others are at distance 1
+        shared_js, containments = containment_index.get_row(i)
+        distances = np.ones(i)
+        distances[shared_js] = 1-containments
+    if is_new is not None and not is_new[i]:
+        keep = is_new[js]
+        js = js[keep]
+        if distances is not None:
+            distances = distances[keep]
+    return js, distances
 
-def get_pairs(genomes, smash, smash_matrix = None, smash_threshold = None):
-    genome_pairs=[]
-    not_pairs=[]
-    n = len(genomes)
-    for i in range(n):
-        j=0
-        while j<i:
-            append = append_pair(smash, smash_threshold, smash_matrix, i, j)
-            if append:
-                genome_pairs.append([genomes[i], genomes[j]])
-            else:
-                not_pairs.append([genomes[i], genomes[j]])
-            j=j+1
-    return genome_pairs, not_pairs
+def get_pair_rows(n, containment_index=None, is_new=None):
+    #yields, for every genome i, the genomes j<i and their sourmash distances to i, in lower triangle order
+    for i in range(1, n):
+        yield (i, *get_row(i, containment_index, is_new))
+
+def get_tiles(n, tile_size, containment_index=None, is_new=None):
+    #yields the lower triangle in square tiles of tile_size x tile_size genomes, each as a list of rows like get_pair_rows
+    number_of_blocks = math.ceil(n/tile_size)
+    for row_block in range(number_of_blocks):
+        row_start = row_block*tile_size
+        row_end = min(row_start+tile_size, n)
+        rows = [(i, *get_row(i, containment_index, is_new)) for i in range(max(row_start, 1), row_end)]
+        for column_block in range(row_block+1):
+            column_start = column_block*tile_size
+            tile = []
+            for i, js, distances in rows:
+                start, end = np.searchsorted(js, [column_start, column_start+tile_size])
+                if end <= start:
+                    continue
+                tile.append((i, js[start:end], None if distances is None else distances[start:end]))
+            yield tile
+
+def get_tile_size(batch_size):
+    #largest tile whose pairs all fit in one batch
+    return max(1, math.isqrt(batch_size))
+
+def split_row(js, distances, smash_threshold):
+    #splits a row into the pairs to compute and the ones filtered out by sourmash, each with their distances
+    if distances is None:
+        return js, None, js[:0], None
+    keep = distances<=smash_threshold
+    return js[keep], distances[keep], js[~keep], distances[~keep]
+
+def get_filtered_rows(rows, smash_threshold):
+    for i, js, distances in rows:
+        yield (i, *split_row(js, distances, smash_threshold))
+
+def get_row_costs(lengths, i, js, distances):
+    if distances is None:
+        return estimate_pair_costs(lengths, i, js)
+    else:
+        return estimate_pair_costs(lengths, i, js, 1-distances)
+
+def get_target_cost(lengths, n, batch_size, containment_index=None, smash_threshold=None, is_new=None):
+    #aim for as many batches as batching by pair count would give, each with an equal share of the total predicted cost
+    total_cost = 0.0
+    number_of_pairs = 0
+    for i, js, distances, not_js, not_distances in get_filtered_rows(get_pair_rows(n, containment_index, is_new), smash_threshold):
+        total_cost += get_row_costs(lengths, i, js, distances).sum()
+        number_of_pairs += len(js)
+    number_of_batches = math.ceil(number_of_pairs/batch_size)
+    if number_of_batches == 0 or total_cost == 0:
+        return None
+    return total_cost/number_of_batches
+
+def write_batch_costs(outputpath, batch_sizes, batch_costs):
+    with open(f"{outputpath}/batches/batch_costs.tsv", "w") as f:
+        f.write("batch\tpairs\tpredicted_cost\n")
+        for batch, (size, cost) in enumerate(zip(batch_sizes, batch_costs)):
+            f.write(f"{batch}\t{size}\t{cost}\n")
 
-def containment_file(not_pairs, genome_index, smash_matrix, containmentpath):
+def containment_file(containmentpath):
     dir = Path(os.path.dirname(containmentpath))
     dir.mkdir(parents=True, exist_ok=True)
-    with open(containmentpath, "w") as f:
-        for el in not_pairs:
-            i = genome_index[el[0]]
-            j = genome_index[el[1]]
-            f.write(f"{el[0]}\t{el[1]}\t{1-smash_matrix[i][j]}\n")
-
-def run_smash(genome_list, sig_path, matrixpath):
-    try:
-        subprocess.run(f"sourmash sketch dna --from-file {genome_list} -o {sig_path}", shell=True, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(e.stderr.decode())
-        print(e)
-        raise e
-    try:
-        subprocess.run(f"sourmash compare {sig_path} --max-containment -o {matrixpath}", shell=True, check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(e.stderr.decode())
-        print(e)
-        raise e
+    return open(containmentpath, "w")
+
+def write_not_pairs(f, genomes, i, not_js, not_distances):
+    f.write("".join([f"{genomes[i]}\t{genomes[j]}\t{distance}\n" for j, distance in zip(not_js, not_distances)]))
+
+SKETCH_KSIZE = 31
+SKETCH_SCALED = 1000
+
+def get_sketch_key(content_hash):
+    #cache key from the file contents (the hash in the genome manifest) and the sketch parameters, so renamed or moved files are still found and changed files are resketched
+    #sourmash and screed are only needed with --sourmash, so they are imported where they are used
+    import sourmash
+    return hashlib.sha256(f"sourmash-{sourmash.VERSION}-k{SKETCH_KSIZE}-scaled{SKETCH_SCALED}-noabund\n{content_hash}".encode()).hexdigest()
+
+def sketch_genome(fasta, sketch_path):
+    #same sketch as "sourmash sketch dna" with default parameters, all records of a file go into one signature
+    import screed
+    import sourmash
+    minhash = sourmash.MinHash(n=0, ksize=SKETCH_KSIZE, scaled=SKETCH_SCALED)
+    with screed.open(fasta) as records:
+        for record in records:
+            minhash.add_sequence(record.sequence, force=True)
+    signature = sourmash.SourmashSignature(minhash, filename=str(fasta))
+    #write to a temporary file first, so runs sharing a cache never see a half-written sketch
+    tmp_path = f"{sketch_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        sourmash.save_signatures([signature], f)
+    os.replace(tmp_path, sketch_path)
+    return sketch_path
+
+def sketch_genomes(fastas, content_hashes, cache_dir, threads=1):
+    #returns the cached sketch of every fasta, sketching only those not in the cache yet
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    sketch_paths = [cache_dir/f"{get_sketch_key(content_hash)}.sig" for content_hash in content_hashes]
+    missing = {}
+    for fasta, sketch_path in zip(fastas, sketch_paths):
+        if not sketch_path.exists():
+            missing[sketch_path] = fasta
+    if len(missing) > 0:
+        with ProcessPoolExecutor(max_workers=max(1, min(threads, len(missing)))) as executor:
+            list(executor.map(sketch_genome, missing.values(), missing.keys()))
+    return sketch_paths
+
+def load_sketch_hashes(sketch_paths):
+    import sourmash
+    sketches = []
+    for sketch_path in sketch_paths:
+        signature = next(iter(sourmash.load_file_as_signatures(str(sketch_path))))
+        sketches.append(np.fromiter(signature.minhash.hashes, dtype=np.uint64))
+    return sketches
+
+class ContainmentIndex:
+    #inverted index from sketch hash to the genomes whose sketch contains it, in CSR layout,
+    #so that only pairs sharing at least one hash are ever looked at instead of the full n x n matrix of "sourmash compare"
+    def __init__(self, sketches):
+        self.sizes = np.array([len(sketch) for sketch in sketches], dtype=np.int64)
+        self.genome_starts = np.concatenate([[0], np.cumsum(self.sizes)])
+        genome_ids = np.repeat(np.arange(len(sketches), dtype=np.int32), self.sizes)
+        hashes = np.concatenate(sketches) if len(sketches) > 0 else np.zeros(0, dtype=np.uint64)
+        unique_hashes, self.genome_hashes = np.unique(hashes, return_inverse=True)
+        self.genome_hashes = self.genome_hashes.reshape(-1)
+        #stable sort keeps the genomes of every hash in ascending order
+        order = np.argsort(self.genome_hashes, kind="stable")
+        self.postings = genome_ids[order]
+        self.posting_starts = np.concatenate([[0], np.cumsum(np.bincount(self.genome_hashes, minlength=len(unique_hashes)))])
+
+    def get_row(self, i):
+        #returns the genomes j<i sharing hashes with genome i, in ascending order, and their max containment with i, as in "sourmash compare --max-containment"
+        hash_ids = self.genome_hashes[self.genome_starts[i]:self.genome_starts[i+1]]
+        starts = self.posting_starts[hash_ids]
+        lengths = self.posting_starts[hash_ids+1]-starts
+        positions = np.repeat(starts-np.cumsum(lengths)+lengths, lengths)+np.arange(lengths.sum())
+        js = self.postings[positions]
+        js, shared = np.unique(js[js<i], return_counts=True)
+        return js.astype(np.int32), shared/np.minimum(self.sizes[i], self.sizes[js])
+
+def build_containment_index(fastas, content_hashes, cache_dir, threads=1):
+    return ContainmentIndex(load_sketch_hashes(sketch_genomes(fastas, content_hashes, cache_dir, threads)))
 
 def main():
     parser = argparse.ArgumentParser(description="Generate lists of genome pairs per batch")
 
-    parser.add_argument("--genomes_list")
+    parser.add_argument("--genome_manifest", help="Genome manifest of the genomes to pair")
     parser.add_argument("--batch_size", type=int)
     parser.add_argument("--outputpath")
     parser.add_argument("--sourmash", action="store_true")
     parser.add_argument("--smash_threshold",type=float)
     parser.add_argument("--containmentpath")
+    parser.add_argument("--batching", choices=["size", "cost", "tiled"], default="size")
     parser.add_argument("--dcj_path")
+    parser.add_argument("--sketch_cache", help="Directory of cached per-genome sourmash sketches (default: OUTPUTPATH/sourmash/sketch_cache)")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--previous_batches", help="Batch manifest directory of a previous run, pairs of two genomes from that run are not batched again")
 
     args = parser.parse_args()
 
+    manifest = read_genome_manifest(args.genome_manifest)
+    genomes = list(manifest.index)
     if args.sourmash:
-        sig_dir = Path(f"{args.outputpath}/sourmash")
-        sig_dir.mkdir(parents=True, exist_ok=True)
-        sig_path = sig_dir/"all_plasmids.sig"
-        matrixpath = sig_dir/"smash_containment_matrix"
-        run_smash(args.genomes_list, sig_path, matrixpath)
-        genomes, genome_index = get_labels(f"{matrixpath}.labels.txt")
-        smash_matrix = np.load(matrixpath)
+        sketch_cache = args.sketch_cache if args.sketch_cache else f"{args.outputpath}/sourmash/sketch_cache"
+        containment_index = build_containment_index(list(manifest["path"]), list(manifest["hash"]), sketch_cache, args.threads)
+        not_pairs_fh = containment_file(args.containmentpath)
     else:
-        genomes, genome_index = get_labels(args.genomes_list)
-        smash_matrix = None
+        containment_index = None
+    if args.previous_batches:
+        previous_genomes = set(read_in_manifest_genomes(args.previous_batches))
+        is_new = np.array([genome not in previous_genomes for genome in genomes], dtype=bool)
+    else:
+        is_new = None
 
-    pairs, not_pairs = get_pairs(genomes, args.sourmash, smash_matrix, args.smash_threshold)
+    n = len(genomes)
+    if args.batching == "cost":
+        lengths = manifest["length"].to_numpy(dtype=np.float64)
+        target_cost = get_target_cost(lengths, n, args.batch_size, containment_index, args.smash_threshold, is_new)
+    else:
+        target_cost = None
 
-    if args.sourmash:
-        containment_file(not_pairs, genome_index, smash_matrix, args.containmentpath)
+    writer = BatchWriter(f"{args.outputpath}/batches", genomes, args.batch_size, target_cost)
+    if args.batching == "tiled":
+        for tile in get_tiles(n, get_tile_size(args.batch_size), containment_index, is_new):
+            rows = list(get_filtered_rows(tile, args.smash_threshold))
+            if writer.pending+sum([len(js) for i, js, distances, not_js, not_distances in rows]) > args.batch_size:
+                writer.flush()
+            for i, js, distances, not_js, not_distances in rows:
+                writer.add(i, js)
+                if args.sourmash:
+                    write_not_pairs(not_pairs_fh, genomes, i, not_js, not_distances)
+    else:
+        for i, js, distances, not_js, not_distances in get_filtered_rows(get_pair_rows(n, containment_index, is_new), args.smash_threshold):
+            if target_cost is None:
+                writer.add(i, js)
+            else:
+                writer.add(i, js, get_row_costs(lengths, i, js, distances))
+            if args.sourmash:
+                write_not_pairs(not_pairs_fh, genomes, i, not_js, not_distances)
+    number_of_batches = writer.close()
 
-    number_of_batches = math.ceil(len(pairs)/args.batch_size)
-    batches = {}
-    for i in range(number_of_batches-1):
-        batches[str(i)] = [pairs[j] for j in range(i*args.batch_size, (i+1)*args.batch_size)]
-        write_batch_file(f"{args.outputpath}/batches", batches, str(i))
-    batches[str(number_of_batches-1)] = [pairs[j] for j in range((number_of_batches-1)*args.batch_size, len(pairs))]
-    write_batch_file(f"{args.outputpath}/batches", batches, str(number_of_batches-1))
+    if args.sourmash:
+        not_pairs_fh.close()
 
     with open(f"{args.outputpath}/batches/batching_info.txt", "w") as f:
         f.write(f"{args.batch_size}\n{number_of_batches}")
 
+    if target_cost is not None:
+        write_batch_costs(args.outputpath, writer.batch_sizes, writer.batch_costs)
+
 if __name__ == "__main__":
     main()
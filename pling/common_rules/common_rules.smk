@@ -3,7 +3,7 @@
 # TODO: prior to including this:
 # OUTPUTPATH
 # GENOMES
-from pling.utils import get_number_of_batches
+from pling.utils import get_number_of_batches, get_pling_root_dir
 
 rule create_genomes_tsv:
     output:
@@ -23,23 +23,70 @@ def get_not_pairs_containment_file():
     else:
         return ""
 
+def get_previous_table(table):
+    #in incremental mode, the rows of the previous run's table (without its header) are added to the new one
+    if config.get("previous_output"):
+        return f"<(tail -n +2 {config['previous_output']}/{table})"
+    else:
+        return ""
+
+def get_one_vs_many():
+    if config.get("one_vs_many", False):
+        return "--one_vs_many"
+    else:
+        return ""
+
+def get_delta_cache():
+    if config.get("delta_cache"):
+        return f"--delta_cache {config['delta_cache']}"
+    else:
+        return ""
+
+def get_cat_containment_output():
+    #with collapsed duplicates, the containment distances between representatives are expanded to all plasmids afterwards
+    if config.get("collapse_duplicates", False):
+        return f"{OUTPUTPATH}/tmp_files/representatives_containment_distance.tsv"
+    else:
+        return f"{OUTPUTPATH}/containment/all_pairs_containment_distance.tsv"
+
 rule cat_containment:
     input:
         containments = expand(f"{OUTPUTPATH}/tmp_files/containment_batchwise/batch_{{batch}}_containment.tsv", batch=[str(i) for i in range(get_number_of_batches(OUTPUTPATH))])
     output:
-        all_containment_distances = f"{OUTPUTPATH}/containment/all_pairs_containment_distance.tsv"
+        all_containment_distances = get_cat_containment_output()
     params:
-        not_pairs = get_not_pairs_containment_file()
+        not_pairs = get_not_pairs_containment_file(),
+        previous = get_previous_table("containment/all_pairs_containment_distance.tsv")
     threads: 1
     resources:
         mem_mb=lambda wildcards, attempt: 4000*attempt
     shell:
         """
-        cat <(echo -e "plasmid_1\tplasmid_2\tdistance") {input.containments} {params.not_pairs}> {output.all_containment_distances}
+        cat <(echo -e "plasmid_1\tplasmid_2\tdistance") {input.containments} {params.not_pairs} {params.previous}> {output.all_containment_distances}
         """
 
 localrules: cat_containment
 
+if config.get("collapse_duplicates", False):
+    rule expand_containment:
+        input:
+            containment = rules.cat_containment.output.all_containment_distances,
+            classes = f"{OUTPUTPATH}/duplicates/duplicate_classes.tsv"
+        output:
+            all_containment_distances = f"{OUTPUTPATH}/containment/all_pairs_containment_distance.tsv"
+        params:
+            pling_root_dir = get_pling_root_dir()
+        threads: 1
+        resources:
+            mem_mb=lambda wildcards, attempt: 4000*attempt
+        shell:
+            """
+            PYTHONPATH={params.pling_root_dir} python {params.pling_root_dir}/pling/common_rules/expand_duplicates.py \
+                --distances {input.containment} \
+                --classes {input.classes} \
+                --output {output.all_containment_distances}
+            """
+
 def get_metadata(metadata):
     if metadata == "None":
         return ""
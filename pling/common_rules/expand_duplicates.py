@@ -0,0 +1,36 @@
+import argparse
+
+def get_members(classes_tsv):
+    #returns the plasmids of every duplicate class, keyed by representative
+    members = {}
+    with open(classes_tsv) as f:
+        next(f)
+        for line in f:
+            plasmid, representative = line.strip().split("\t")
+            members.setdefault(representative, []).append(plasmid)
+    return members
+
+def expand_distances(distances_tsv, members, output):
+    #every distance between two representatives applies to all pairs of their members, and members of the same class are at distance 0
+    with open(distances_tsv) as distances_fh, open(output, "w") as out:
+        out.write(next(distances_fh))
+        for line in distances_fh:
+            plasmid_1, plasmid_2, distance = line.strip().split("\t")
+            out.write("".join([f"{member_1}\t{member_2}\t{distance}\n" for member_1 in members[plasmid_1] for member_2 in members[plasmid_2]]))
+        for plasmids in members.values():
+            for index, plasmid_1 in enumerate(plasmids):
+                out.write("".join([f"{plasmid_1}\t{plasmid_2}\t0\n" for plasmid_2 in plasmids[index+1:]]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand a distance table between duplicate class representatives to all plasmids")
+
+    parser.add_argument("--distances", required=True, help="tsv of distances between representatives")
+    parser.add_argument("--classes", required=True, help="tsv of the representative of every plasmid")
+    parser.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+
+    expand_distances(args.distances, get_members(args.classes), args.output)
+
+if __name__ == "__main__":
+    main()
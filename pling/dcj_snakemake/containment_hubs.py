@@ -0,0 +1,55 @@
+import argparse
+
+def get_containment_graph(containment_tsv, containment_distance):
+    #adjacency sets of the containment network, with the same edges as plasnet split
+    graph = {}
+    with open(containment_tsv) as f:
+        next(f)
+        for line in f:
+            plasmid_1, plasmid_2, distance = line.strip().split("\t")
+            if plasmid_1 != plasmid_2 and float(distance) <= containment_distance:
+                graph.setdefault(plasmid_1, set()).add(plasmid_2)
+                graph.setdefault(plasmid_2, set()).add(plasmid_1)
+    return graph
+
+def is_hub(graph, plasmid, bh_connectivity, bh_neighbours_edge_density):
+    neighbours = graph[plasmid]
+    if len(neighbours) < bh_connectivity:
+        return False
+    edges_between_neighbours = sum(len(graph[neighbour] & neighbours) for neighbour in neighbours)//2
+    max_edges_between_neighbours = (len(neighbours)*(len(neighbours)-1))//2
+    return edges_between_neighbours/max_edges_between_neighbours <= bh_neighbours_edge_density
+
+def get_hub_plasmids(graph, bh_connectivity, bh_neighbours_edge_density):
+    #same rule as plasnet's hub detection: plasmids with many neighbours that are barely connected to each other are hubs, and hubs are removed until none are left
+    hub_plasmids = set()
+    while True:
+        hubs = [plasmid for plasmid in graph if is_hub(graph, plasmid, bh_connectivity, bh_neighbours_edge_density)]
+        if not hubs:
+            return hub_plasmids
+        hub_plasmids.update(hubs)
+        for hub in hubs:
+            for neighbour in graph.pop(hub):
+                if neighbour in graph:
+                    graph[neighbour].discard(hub)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the hub plasmids of the containment network")
+
+    parser.add_argument("--containment", required=True, help="tsv of containment distances of all pairs")
+    parser.add_argument("--containment_distance", required=True, type=float)
+    parser.add_argument("--bh_connectivity", required=True, type=int)
+    parser.add_argument("--bh_neighbours_edge_density", required=True, type=float)
+    parser.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+
+    graph = get_containment_graph(args.containment, args.containment_distance)
+    hub_plasmids = get_hub_plasmids(graph, args.bh_connectivity, args.bh_neighbours_edge_density)
+    with open(args.output, "w") as f:
+        f.write("hub_plasmids\n")
+        for plasmid in sorted(hub_plasmids):
+            f.write(f"{plasmid}\n")
+
+if __name__ == "__main__":
+    main()
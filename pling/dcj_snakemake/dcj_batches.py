@@ -0,0 +1,116 @@
+import argparse
+import heapq
+import math
+from pathlib import Path
+from pling.utils import get_number_of_batches, read_genome_manifest, get_genome_manifest_path, BatchManifestWriter
+from pling.dcj_snakemake.shared_functions import get_plasmid_to_community, get_containment_distances_for_batch, get_hub_plasmids, touches_hub, get_entries
+
+def read_in_unimog_entries(unimog_filepath, entries):
+    #returns the header and sequence lines of the given entries of a unimog, and the number of integers in each
+    unimogs = {}
+    sizes = {}
+    with open(unimog_filepath) as unimog:
+        entry = None
+        for line in unimog:
+            if line[0]==">":
+                entry = line.strip(">\n")
+                if entry in entries:
+                    unimogs[entry] = line
+                    sizes[entry] = 0
+            elif entry in entries:
+                unimogs[entry] += line
+                sizes[entry] += len(line.strip(")|\n").split())
+    return unimogs, sizes
+
+def get_source_unimog(outputpath, integerisation, plasmid_to_community, batch, genome1):
+    if integerisation == "align":
+        return f"{outputpath}/unimogs/batch_{batch}_align.unimog"
+    elif integerisation == "anno":
+        return f"{outputpath}/unimogs/relabelled/blocks/{plasmid_to_community[genome1]}_blocks.unimog"
+
+def get_dcj_pairs(outputpath, integerisation, containment_distance, plasmid_to_community, hub_plasmids):
+    #returns the pairs that DCJ-Indel distances are needed for, grouped by the unimog they are in, and the pairs skipped because of hub plasmids
+    pairs = {}
+    skipped = []
+    for batch in range(get_number_of_batches(outputpath)):
+        containments = get_containment_distances_for_batch(f"{outputpath}/tmp_files/containment_batchwise/batch_{batch}_containment.tsv")
+        for (genome1, genome2), containment in containments.items():
+            if containment > containment_distance:
+                continue
+            if plasmid_to_community is not None and plasmid_to_community[genome1] != plasmid_to_community[genome2]:
+                continue
+            if touches_hub(hub_plasmids, genome1, genome2):
+                skipped.append((genome1, genome2))
+                continue
+            unimog = get_source_unimog(outputpath, integerisation, plasmid_to_community, batch, genome1)
+            pairs.setdefault(unimog, []).append((genome1, genome2))
+    return pairs, skipped
+
+def balance_batches(weights, number_of_batches):
+    #longest processing time first: the heaviest remaining pair goes to the currently lightest batch
+    batches = [[] for _ in range(number_of_batches)]
+    loads = [(0, index) for index in range(number_of_batches)]
+    for pair_index in sorted(range(len(weights)), key=lambda index: -weights[index]):
+        load, index = heapq.heappop(loads)
+        batches[index].append(pair_index)
+        heapq.heappush(loads, (load+weights[pair_index], index))
+    return [sorted(batch) for batch in batches]
+
+def write_dcj_batches(outputpath, integerisation, containment_distance, communitypath, hubpath, batch_size, output_dir):
+    plasmid_to_community = get_plasmid_to_community(communitypath) if integerisation == "anno" else None
+    hub_plasmids = get_hub_plasmids(hubpath) if hubpath else None
+    pairs_by_unimog, skipped = get_dcj_pairs(outputpath, integerisation, containment_distance, plasmid_to_community, hub_plasmids)
+
+    #integer sequences of all pairs, weighted by their total number of integers, which the size of the ILP grows with
+    pairs = []
+    pair_unimogs = []
+    weights = []
+    for unimog_filepath, unimog_pairs in pairs_by_unimog.items():
+        entries = {entry for genome1, genome2 in unimog_pairs for entry in get_entries(integerisation, genome1, genome2)}
+        unimogs, sizes = read_in_unimog_entries(unimog_filepath, entries)
+        for genome1, genome2 in unimog_pairs:
+            entry1, entry2 = get_entries(integerisation, genome1, genome2)
+            pairs.append((genome1, genome2))
+            pair_unimogs.append((unimogs[entry1], unimogs[entry2]))
+            weights.append(sizes[entry1]+sizes[entry2])
+
+    genomes = list(read_genome_manifest(get_genome_manifest_path(outputpath)).index)
+    genome_index = {genome: index for index, genome in enumerate(genomes)}
+    batches = balance_batches(weights, math.ceil(len(pairs)/batch_size))
+
+    output_dir = Path(output_dir)
+    manifest = BatchManifestWriter(output_dir, genomes)
+    for batch, pair_indices in enumerate(batches):
+        manifest.write_batch([genome_index[pairs[index][0]] for index in pair_indices], [genome_index[pairs[index][1]] for index in pair_indices])
+        with open(output_dir/f"batch_{batch}.unimog", "w") as f:
+            written = set()
+            for index in pair_indices:
+                for unimog in pair_unimogs[index]:
+                    #in anno mode, a genome's entry is shared by all its pairs
+                    if unimog not in written:
+                        f.write(unimog)
+                        written.add(unimog)
+    manifest.close()
+
+    with open(output_dir/"skipped_hub_pairs.tsv", "w") as f:
+        f.write("plasmid_1\tplasmid_2\n")
+        for genome1, genome2 in skipped:
+            f.write(f"{genome1}\t{genome2}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch the pairs passing the containment threshold for DCJ-Indel calculation, balanced by the size of their integer sequences.")
+
+    parser.add_argument("--outputpath", required=True, help="Path for general output directory")
+    parser.add_argument("--integerisation", required=True, type=str)
+    parser.add_argument("--containment_distance", required=True, type=float)
+    parser.add_argument("--communitypath", required=True)
+    parser.add_argument("--hubpath", help="hub plasmids of the containment network, pairs with a hub plasmid are not batched if given")
+    parser.add_argument("--batch_size", required=True, type=int)
+    parser.add_argument("--output_dir", required=True)
+
+    args = parser.parse_args()
+
+    write_dcj_batches(args.outputpath, args.integerisation, args.containment_distance, args.communitypath, args.hubpath, args.batch_size, args.output_dir)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import subprocess
 import argparse
-from pling.utils import read_in_batch_pairs
+from pling.utils import read_in_batch_pairs, scratch_directory
 from pathlib import Path
 from shared_functions import *
 
@@ -39,20 +39,20 @@ def dcj_dist(unimog, solution, genome1, genome2):
         raise e
     return dist
 
-def batchwise_ding(pairs, containment_distance, containments, integerisation, outputpath, batch, timelimit, snakefile_dir, plasmid_to_community):
+def batchwise_ding(pairs, integerisation, outputpath, batch, timelimit, snakefile_dir, scratch):
+    #all pairs of a DCJ batch passed the containment threshold, and their integer sequences are in the batch's unimog
     dists = []
+    unimog = get_unimog(outputpath, batch)
     for pair in pairs:
         genome1 = pair[0]
         genome2 = pair[1]
-        lp = f"ding/ilp/{genome1}~{genome2}.lp"
-        solution = f"ding/solutions/{genome1}~{genome2}.sol"
+        lp = f"{scratch}/{genome1}~{genome2}.lp"
+        solution = f"{scratch}/{genome1}~{genome2}.sol"
         entry1, entry2 = get_entries(integerisation, genome1, genome2)
-        if containments[(genome1,genome2)]<=containment_distance:
-            unimog = get_unimog(outputpath, integerisation, plasmid_to_community, batch, genome1, genome2)
-            unimog_to_ilp(unimog, lp, entry1, entry2)
-            ilp_GLPK(lp, solution, snakefile_dir, timelimit)
-            dist = dcj_dist(unimog, solution, entry1, entry2)
-            dists.append(f"{genome1}\t{genome2}\t{dist}\n")
+        unimog_to_ilp(unimog, lp, entry1, entry2)
+        ilp_GLPK(lp, solution, snakefile_dir, timelimit)
+        dist = dcj_dist(unimog, solution, entry1, entry2)
+        dists.append(f"{genome1}\t{genome2}\t{dist}\n")
     with open(f"{outputpath}/tmp_files/dists_batchwise/batch_{batch}_dcj.tsv", "w") as f:
         for line in dists:
             f.write(line)
@@ -63,14 +63,13 @@ def main():
 
     # Add the arguments
     parser.add_argument("--batch", required=True, help="Batch number")
-    parser.add_argument("--containment_tsv", required=True)
-    parser.add_argument("--containment_distance", required=True)
     parser.add_argument("--outputpath", required=True, help="Path for general output directory")
-    parser.add_argument("--communitypath", required=True)
     parser.add_argument("--integerisation", required=True, type=str)
     parser.add_argument("--threads")
     parser.add_argument("--timelimit")
     parser.add_argument("--snakefile_dir", required=True)
+    parser.add_argument("--scratch_dir", help="Directory to create the job's scratch directory for ILPs and solutions in, default is /dev/shm if available")
+    parser.add_argument("--keep_scratch", action="store_true", help="Don't remove the scratch directory after the job, e.g. to inspect the ILP of a failed pair")
 
     # Parse the arguments
     args = parser.parse_args()
@@ -80,19 +79,10 @@ def main():
     else:
         timelimit=f"--tmlim {args.timelimit}"
 
-    pairs=read_in_batch_pairs(f"{args.outputpath}/batches/batch_{args.batch}.txt")
-    containments=get_containment_distances_for_batch(args.containment_tsv)
+    pairs=read_in_batch_pairs(get_dcj_batches_dir(args.outputpath), args.batch)
 
-    output_dirs = [Path(f"ding/ilp"), Path(f"ding/solutions")]
-    for dir in output_dirs:
-        dir.mkdir(parents=True, exist_ok=True)
-
-    if args.integerisation=="anno":
-        plasmid_to_community = get_plasmid_to_community(args.communitypath)
-    else:
-        plasmid_to_community=None
-
-    batchwise_ding(pairs, float(args.containment_distance), containments, args.integerisation, args.outputpath, args.batch, timelimit, args.snakefile_dir, plasmid_to_community)
+    with scratch_directory(f"glpk_and_ding_{args.batch}", args.scratch_dir, args.keep_scratch) as scratch:
+        batchwise_ding(pairs, args.integerisation, args.outputpath, args.batch, timelimit, args.snakefile_dir, scratch)
 
 if __name__ == "__main__":
     main()
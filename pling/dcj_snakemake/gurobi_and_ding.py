@@ -1,5 +1,6 @@
 import argparse
-from pling.utils import read_in_batch_pairs
+import os
+from pling.utils import read_in_batch_pairs, scratch_directory
 from pathlib import Path
 from dingII.dingII_generate import *
 from dingII.ilp_util_adj import *
@@ -115,16 +116,16 @@ def compute_DCJ(unimog, entry1, entry2, timelimit, threads):
         raise e
     return int(round(dist))
 
-def batchwise_ding(pairs, containment_distance, containments, integerisation, outputpath, batch, timelimit, threads, plasmid_to_community):
+def batchwise_ding(pairs, integerisation, outputpath, batch, timelimit, threads):
+    #all pairs of a DCJ batch passed the containment threshold, and their integer sequences are in the batch's unimog
     dists = []
+    unimog = get_unimog(outputpath, batch)
     for pair in pairs:
         genome1 = pair[0]
         genome2 = pair[1]
         entry1, entry2 = get_entries(integerisation, genome1, genome2)
-        if containments[(genome1,genome2)]<=containment_distance:
-            unimog = get_unimog(outputpath, integerisation, plasmid_to_community, batch, genome1, genome2)
-            dist = compute_DCJ(unimog, entry1, entry2, timelimit, threads)
-            dists.append(f"{genome1}\t{genome2}\t{dist}\n")
+        dist = compute_DCJ(unimog, entry1, entry2, timelimit, threads)
+        dists.append(f"{genome1}\t{genome2}\t{dist}\n")
     with open(f"{outputpath}/tmp_files/dists_batchwise/batch_{batch}_dcj.tsv", "w") as f:
         for line in dists:
             f.write(line)
@@ -135,26 +136,27 @@ def main():
 
     # Add the arguments
     parser.add_argument("--batch", required=True, help="Batch number")
-    parser.add_argument("--containment_tsv", required=True)
-    parser.add_argument("--containment_distance", required=True)
     parser.add_argument("--outputpath", required=True, help="Path for general output directory")
-    parser.add_argument("--communitypath", required=True)
     parser.add_argument("--integerisation", required=True, type=str)
     parser.add_argument("--threads", required=True, type=int)
     parser.add_argument("--timelimit")
+    parser.add_argument("--scratch_dir", help="Directory to create the job's scratch directory in, default is /dev/shm if available")
+    parser.add_argument("--keep_scratch", action="store_true", help="Don't remove the scratch directory after the job")
 
     # Parse the arguments
     args = parser.parse_args()
 
-    pairs=read_in_batch_pairs(f"{args.outputpath}/batches/batch_{args.batch}.txt")
-    containments=get_containment_distances_for_batch(args.containment_tsv)
+    pairs=read_in_batch_pairs(get_dcj_batches_dir(args.outputpath), args.batch)
 
-    if args.integerisation=="anno":
-        plasmid_to_community = get_plasmid_to_community(args.communitypath)
-    else:
-        plasmid_to_community=None
-
-    batchwise_ding(pairs, float(args.containment_distance), containments, args.integerisation, args.outputpath, args.batch, args.timelimit, args.threads, plasmid_to_community)
+    #gurobi writes its log to the working directory, so the job runs in its scratch directory
+    outputpath = os.path.abspath(args.outputpath)
+    workdir = os.getcwd()
+    with scratch_directory(f"gurobi_and_ding_{args.batch}", args.scratch_dir, args.keep_scratch) as scratch:
+        os.chdir(scratch)
+        try:
+            batchwise_ding(pairs, args.integerisation, outputpath, args.batch, args.timelimit, args.threads)
+        finally:
+            os.chdir(workdir)
 
 if __name__ == "__main__":
     main()
@@ -7,6 +7,14 @@ def get_plasmid_to_community(communitypath):
                 plasmid_to_community[plasmid] = community_index
     return plasmid_to_community
 
+def get_hub_plasmids(hubpath):
+    with open(hubpath) as hubs_fh:
+        next(hubs_fh)
+        return {line.strip() for line in hubs_fh if line.strip()}
+
+def touches_hub(hub_plasmids, genome1, genome2):
+    return hub_plasmids is not None and (genome1 in hub_plasmids or genome2 in hub_plasmids)
+
 def get_containment_distances_for_batch(containment_tsv):
     containments = {}
     with open(containment_tsv, "r") as f:
@@ -16,14 +24,11 @@ def get_containment_distances_for_batch(containment_tsv):
             containments[(plasmid_1,plasmid_2)] = containment
     return containments
 
-def get_unimog(outputpath, integerisation, plasmid_to_community, batch, genome1, genome2):
-    unimog = ""
-    if integerisation == "align":
-        unimog = f"{outputpath}/unimogs/batch_{batch}_align.unimog"
-    elif integerisation == "anno":
-        community = plasmid_to_community[genome1]
-        unimog = f"{outputpath}/unimogs/relabelled/blocks/{community}_blocks.unimog"
-    return unimog
+def get_dcj_batches_dir(outputpath):
+    return f"{outputpath}/tmp_files/dcj_batches"
+
+def get_unimog(outputpath, batch):
+    return f"{get_dcj_batches_dir(outputpath)}/batch_{batch}.unimog"
 
 def get_entries(integerisation, genome_1, genome_2):
     if integerisation == "align":
@@ -0,0 +1,34 @@
+import argparse
+from pling.common_rules.expand_duplicates import get_members
+
+def write_typing_distances(distances_tsv, hub_pairs_tsv, dcj_dist_threshold, classes_tsv, output):
+    #plasnet type treats pairs without a distance as unconnected and then looks for hubs in what is left, so skipped hub pairs are
+    #added at the threshold: they stay edges for hub detection, and the hub plasmid is removed before they could be used for typing.
+    #The one exception is a hub whose degree drops below --bh_connectivity because one of its neighbours was only a hub after DCJ-Indel filtering
+    members = get_members(classes_tsv) if classes_tsv else None
+    with open(distances_tsv) as distances_fh, open(hub_pairs_tsv) as hub_pairs_fh, open(output, "w") as out:
+        for line in distances_fh:
+            out.write(line)
+        next(hub_pairs_fh)
+        for line in hub_pairs_fh:
+            plasmid_1, plasmid_2 = line.strip().split("\t")
+            if members is None:
+                out.write(f"{plasmid_1}\t{plasmid_2}\t{dcj_dist_threshold}\n")
+            else:
+                out.write("".join([f"{member_1}\t{member_2}\t{dcj_dist_threshold}\n" for member_1 in members[plasmid_1] for member_2 in members[plasmid_2]]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the pairs skipped because of hub plasmids to the distances used for typing")
+
+    parser.add_argument("--distances", required=True, help="tsv of DCJ-Indel distances")
+    parser.add_argument("--hub_pairs", required=True, help="tsv of pairs skipped because of hub plasmids")
+    parser.add_argument("--dcj_dist_threshold", required=True, type=int)
+    parser.add_argument("--classes", help="tsv of the representative of every plasmid, if duplicates were collapsed")
+    parser.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+
+    write_typing_distances(args.distances, args.hub_pairs, args.dcj_dist_threshold, args.classes, args.output)
+
+if __name__ == "__main__":
+    main()
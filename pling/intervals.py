@@ -0,0 +1,144 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+def get_coverage(intervals):
+    #number of positions covered by the union of the half-open [start, end) intervals,
+    #by sweeping over the sorted interval starts and ends and summing the gaps between consecutive ones where at least one interval is open
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    if len(intervals) == 0:
+        return 0
+    positions = intervals.T.ravel()
+    steps = np.repeat(np.array([1, -1], dtype=np.int64), len(intervals))
+    order = np.argsort(positions, kind="stable")
+    depth = np.cumsum(steps[order])
+    lengths = np.diff(positions[order])
+    return int(lengths[depth[:-1] > 0].sum())
+
+def get_gaps(intervals, total_length, length_threshold=0):
+    #the maximal runs of positions 1 to total_length that no half-open [start, end) interval covers, as [start, end) intervals,
+    #keeping only runs longer than length_threshold
+    gaps = []
+    pos = 1
+    for start, end in sorted(intervals):
+        if start > pos:
+            gaps.append((pos, min(start, total_length+1)))
+        pos = max(pos, end)
+        if pos > total_length:
+            break
+    if pos <= total_length:
+        gaps.append((pos, total_length+1))
+    return [(start, end) for start, end in gaps if start <= total_length and end-start > length_threshold]
+
+class IntervalIndex:
+    #a set of half-open [start, end) intervals with a value each, as in intervaltree: adding an interval that is already there does nothing,
+    #and null intervals can't be added
+    #the intervals are kept in lists sorted by start, end and the order they were added in, alongside the largest end of every prefix of them,
+    #so that queries bisect to the intervals starting in range and walk back only while the running largest end can still reach the query range
+    #queries return (start, end, value) tuples in that order
+    def __init__(self, intervals=()):
+        self.keys = []
+        self.values = []
+        self.max_ends = []
+        self.interval_keys = {}
+        self.added = 0
+        for start, end, value in intervals:
+            self.add(start, end, value)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, interval):
+        return interval in self.interval_keys
+
+    def __iter__(self):
+        #the intervals in index order
+        return iter([(start, end, value) for (start, end, order), value in zip(self.keys, self.values)])
+
+    def add(self, start, end, value):
+        if (start, end, value) in self.interval_keys:
+            return
+        if start >= end:
+            raise ValueError(f"[{start}, {end}) is a null interval and can't be added to the index")
+        key = (start, end, self.added)
+        self.added += 1
+        self.interval_keys[(start, end, value)] = key
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.values.insert(position, value)
+        max_ends = self.max_ends
+        max_ends.insert(position, end if position == 0 else max(max_ends[position-1], end))
+        #the running largest end only changes up to the first interval after it that already reaches as far
+        position += 1
+        while position < len(max_ends) and max_ends[position] < end:
+            max_ends[position] = end
+            position += 1
+
+    def remove(self, start, end, value):
+        if (start, end, value) not in self.interval_keys:
+            raise ValueError(f"[{start}, {end}) with value {value} is not in the index")
+        position = bisect_left(self.keys, self.interval_keys.pop((start, end, value)))
+        del self.keys[position]
+        del self.values[position]
+        del self.max_ends[position]
+        max_ends = self.max_ends
+        max_end = max_ends[position-1] if position > 0 else None
+        for position in range(position, len(max_ends)):
+            interval_end = self.keys[position][1]
+            if max_end is None or interval_end > max_end:
+                max_end = interval_end
+            if max_ends[position] == max_end:
+                break
+            max_ends[position] = max_end
+
+    def discard(self, start, end, value):
+        if (start, end, value) in self.interval_keys:
+            self.remove(start, end, value)
+
+    def overlap(self, start, end):
+        #intervals sharing at least one position with [start, end), found from the last interval starting before end
+        #backwards, for as long as the running largest end still reaches past start
+        found = []
+        if start >= end:
+            return found
+        keys = self.keys
+        max_ends = self.max_ends
+        position = bisect_left(keys, (end,))-1
+        while position >= 0 and max_ends[position] > start:
+            if keys[position][1] > start:
+                found.append((keys[position][0], keys[position][1], self.values[position]))
+            position -= 1
+        found.reverse()
+        return found
+
+    def envelop(self, start, end):
+        #intervals lying entirely within [start, end)
+        found = []
+        if start >= end:
+            return found
+        keys = self.keys
+        position = bisect_left(keys, (start,))
+        while position < len(keys) and keys[position][0] < end:
+            if keys[position][1] <= end:
+                found.append((keys[position][0], keys[position][1], self.values[position]))
+            position += 1
+        return found
+
+    def contain(self, start, end):
+        #intervals containing all of [start, end), found from the last interval starting at or before start
+        #backwards, for as long as the running largest end still reaches end
+        found = []
+        if start >= end:
+            return found
+        keys = self.keys
+        max_ends = self.max_ends
+        position = bisect_right(keys, (start, float("inf")))-1
+        while position >= 0 and max_ends[position] >= end:
+            if keys[position][1] >= end:
+                found.append((keys[position][0], keys[position][1], self.values[position]))
+            position -= 1
+        found.reverse()
+        return found
+
+    def at(self, point):
+        #intervals containing point
+        return self.overlap(point, point+1)
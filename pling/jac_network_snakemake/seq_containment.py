@@ -1,57 +1,44 @@
 import subprocess
+import re
 from pathlib import Path
 from typing import Tuple
-from intervaltree import IntervalTree
 import argparse
-from pling.utils import read_in_batch_pairs, get_fasta_file_info
-
-def get_coverage(tree):
-    tree.merge_overlaps()
-    coverage = 0
-    for interval in tree:
-        coverage = coverage + (interval.end - interval.begin)
-    return coverage
-
-def get_coordinates(split_line, index):
-    start = int(split_line[index])
-    end = int(split_line[index+1])
-    if start > end:
-        start, end = end, start
-    end+=1
-    return start, end
-
-def get_sequence_containment_distance(plasmid_1: Path, plasmid_2: Path, prefix: str, identity_threshold=80) -> Tuple[str, str]:
-    subprocess.check_call(f"perl -w $(which dnadiff) {plasmid_1} {plasmid_2} -p {prefix} 2>/dev/null", shell=True)
-    show_coords_output = subprocess.check_output(f"show-coords -TrcldH -I {identity_threshold} {prefix}.1delta", shell=True).strip().split(b'\n')  # TODO: what about this threshold?
-
-    assert(len(show_coords_output)>0)
-
+from pling.intervals import get_coverage
+from pling.utils import read_in_batch_pairs, get_manifest_fasta_file_info, read_genome_manifest_column, scratch_directory
+from pling.alignment import read_delta, get_coords, align_pair, align_one_vs_many, map_pairs_in_order
+
+NUCMER_OPTIONS = "--maxmatch"
+MAPPY_PRESET = "map-hifi" #the asm presets skip alignments of repeat copies that nucmer reports at over 99% identity, see tests/jac_network_snakemake/containment_test_cases
+MAPPY_MAX_GAP = 50
+CS_OPERATIONS = re.compile(r"(:[0-9]+|\*[a-z][a-z]|[+\-][a-z]+)")
+
+def align_one_to_one(plasmid_1: Path, plasmid_2: Path, prefix: str):
+    #the alignment and 1-to-1 filtering steps of dnadiff, which are all the containment distance needs, without its snps, diff and report files
+    subprocess.check_call(f"nucmer {NUCMER_OPTIONS} -p {prefix} {plasmid_1} {plasmid_2} 2>/dev/null && delta-filter -1 {prefix}.delta > {prefix}.1delta", shell=True)
+
+def get_sequence_containment_distance(plasmid_1: Path, plasmid_2: Path, prefix: str, identity_threshold=80, aligned=False) -> Tuple[str, str]:
+    #if aligned, {prefix}.1delta has already been written by pling.alignment
+    if not aligned:
+        align_one_to_one(plasmid_1, plasmid_2, prefix)
     len_ref = -1
     len_query = -1
-    ref_to_block = IntervalTree()
-    query_to_block = IntervalTree()
-    for block, line in enumerate(show_coords_output):
-        split_line = line.split(b'\t')
-
-        try:
-            start_ref, end_ref = get_coordinates(split_line, 0)
-            start_query, end_query = get_coordinates(split_line, 2)
-        except ValueError:
-            continue
-
-        len_ref = int(split_line[7])
-        len_query = int(split_line[8])
-        ref_to_block[start_ref:end_ref] = block
-        query_to_block[start_query:end_query] = block
+    ref_intervals = []
+    query_intervals = []
+    for start_ref, end_ref, start_query, end_query, len_ref, len_query, strand in get_coords(read_delta(f"{prefix}.1delta"), identity_threshold):
+        ref_intervals.append((start_ref, end_ref))
+        query_intervals.append((start_query, end_query))
 
-    for extension in [".1coords", ".1delta", ".delta", ".mcoords", ".mdelta", ".qdiff", ".rdiff", ".report", ".snps", ".unqry", ".unref"]:
+    for extension in [".1delta", ".delta"]:
         try:
             Path(prefix+extension).unlink()
         except:
             pass
 
-    coverage_ref = get_coverage(ref_to_block)
-    coverage_query = get_coverage(query_to_block)
+    return get_containment_distance(ref_intervals, query_intervals, len_ref, len_query)
+
+def get_containment_distance(ref_intervals, query_intervals, len_ref, len_query):
+    coverage_ref = get_coverage(ref_intervals)
+    coverage_query = get_coverage(query_intervals)
 
     if len_ref>len_query:
         containment_similarity = coverage_query/len_query
@@ -61,14 +48,96 @@ def get_sequence_containment_distance(plasmid_1: Path, plasmid_2: Path, prefix:
     containment_distance = 1-containment_similarity
     return containment_distance
 
-def batchwise_containment(fastafiles, pairs, containmentpath, identity_threshold):
+def get_mappy_segments(hit, max_gap=MAPPY_MAX_GAP):
+    #minimap2 chains through long indels that end nucmer alignments, which would pull the identity of whole alignments below the threshold,
+    #so alignments are split at indels longer than max_gap, using the cs tag, into (rstart, rend, qstart, qend, identity) segments
+    segments = []
+    ref_pos = hit.r_st
+    aligned_pos = 0 #position along the query, in the orientation it is aligned in
+    start = None
+    matches = 0
+    block_length = 0
+    for op in CS_OPERATIONS.findall(hit.cs):
+        if op[0] == ":" or op[0] == "*":
+            length = int(op[1:]) if op[0] == ":" else 1
+            if start is None:
+                start = (ref_pos, aligned_pos)
+            if op[0] == ":":
+                matches += length
+            ref_pos += length
+            aligned_pos += length
+            block_length += length
+            continue
+        length = len(op)-1
+        if length > max_gap:
+            if start is not None:
+                segments.append((start[0], ref_pos, start[1], aligned_pos, matches, block_length))
+            start = None
+            matches = 0
+            block_length = 0
+        elif start is not None:
+            block_length += length
+        if op[0] == "+":
+            aligned_pos += length
+        else:
+            ref_pos += length
+    if start is not None:
+        segments.append((start[0], ref_pos, start[1], aligned_pos, matches, block_length))
+
+    query_segments = []
+    for rstart, rend, aligned_start, aligned_end, matches, block_length in segments:
+        if hit.strand == 1:
+            qstart, qend = hit.q_st+aligned_start, hit.q_st+aligned_end
+        else:
+            qstart, qend = hit.q_en-aligned_end, hit.q_en-aligned_start
+        query_segments.append((rstart, rend, qstart, qend, 100*matches/block_length))
+    return query_segments
+
+def get_mappy_containment_distance(aligner, len_ref, query_fasta, identity_threshold):
+    #coordinates are shifted to the 1-based, end-exclusive intervals of the nucmer engine, and as there, alignments on different records share one coordinate space
+    import mappy
+    ref_intervals = []
+    query_intervals = []
+    len_query = 0
+    for name, sequence, quality in mappy.fastx_read(query_fasta):
+        len_query += len(sequence)
+        for hit in aligner.map(sequence, cs=True):
+            if not hit.is_primary:
+                continue
+            for rstart, rend, qstart, qend, identity in get_mappy_segments(hit):
+                if identity >= identity_threshold:
+                    ref_intervals.append((rstart+1, rend+1))
+                    query_intervals.append((qstart+1, qend+1))
+    return get_containment_distance(ref_intervals, query_intervals, len_ref, len_query)
+
+def pair_containment(genome_1, genome_2, fastafiles, hashes, identity_threshold, delta_cache, scratch_dir, keep_scratch):
+    #every pair is aligned in its own scratch directory, so that pairs running concurrently don't share files
+    with scratch_directory(f"{genome_1}~{genome_2}", scratch_dir, keep_scratch) as scratch:
+        prefix = f"{scratch}/{genome_1}~{genome_2}"
+        align_pair(genome_1, genome_2, fastafiles, prefix, NUCMER_OPTIONS, hashes, delta_cache)
+        return get_sequence_containment_distance(fastafiles[genome_1], fastafiles[genome_2], prefix, identity_threshold, aligned=True)
+
+def reference_containment(genome_1, partners, fastafiles, hashes, identity_threshold, delta_cache, scratch_dir, keep_scratch):
+    #the reference genome is aligned once against all its partners
+    with scratch_directory(genome_1, scratch_dir, keep_scratch) as scratch:
+        prefixes = {genome_2: f"{scratch}/{genome_1}~{genome_2}" for genome_2 in partners}
+        align_one_vs_many(genome_1, fastafiles, prefixes, NUCMER_OPTIONS, f"{scratch}/{genome_1}~queries", hashes, delta_cache)
+        return [get_sequence_containment_distance(fastafiles[genome_1], fastafiles[genome_2], prefixes[genome_2], identity_threshold, aligned=True) for genome_2 in partners]
+
+def mappy_reference_containment(genome_1, partners, fastafiles, hashes, identity_threshold, delta_cache, scratch_dir, keep_scratch):
+    #the minimap2 engine indexes the reference in memory once and maps its partners against it, without any files or processes per pair
+    import mappy
+    aligner = mappy.Aligner(fastafiles[genome_1], preset=MAPPY_PRESET)
+    len_ref = sum([len(aligner.seq(name)) for name in aligner.seq_names])
+    return [get_mappy_containment_distance(aligner, len_ref, fastafiles[genome_2], identity_threshold) for genome_2 in partners]
+
+def batchwise_containment(fastafiles, pairs, containmentpath, identity_threshold, one_vs_many=False, threads=1, hashes=None, delta_cache=None, engine="nucmer", scratch_dir=None, keep_scratch=False):
     containments = []
-    for pair in pairs:
-        genome_1 = pair[0]
-        genome_2 = pair[1]
-        genome_1_fasta = fastafiles[genome_1]
-        genome_2_fasta = fastafiles[genome_2]
-        containment_distance = get_sequence_containment_distance(genome_1_fasta, genome_2_fasta, f"{genome_1}~{genome_2}", identity_threshold)
+    if engine == "minimap2":
+        containment_distances = map_pairs_in_order(None, mappy_reference_containment, pairs, fastafiles, hashes, (identity_threshold, delta_cache, scratch_dir, keep_scratch), True, threads)
+    else:
+        containment_distances = map_pairs_in_order(pair_containment, reference_containment, pairs, fastafiles, hashes, (identity_threshold, delta_cache, scratch_dir, keep_scratch), one_vs_many, threads)
+    for (genome_1, genome_2), containment_distance in zip(pairs, containment_distances):
         containments.append(f"{genome_1}\t{genome_2}\t{containment_distance}\n")
     with open(containmentpath, 'w') as f:
         for line in containments:
@@ -76,20 +145,32 @@ def batchwise_containment(fastafiles, pairs, containmentpath, identity_threshold
 
 
 def main(args):
-    fastafiles, fastaext, fastapath = get_fasta_file_info(args.genomes_list)
+    fastafiles, fastaext, fastapath = get_manifest_fasta_file_info(args.genome_manifest)
+
+    pairs=read_in_batch_pairs(f"{args.outputpath}/batches", args.batch)
 
-    pairs=read_in_batch_pairs(f"{args.outputpath}/batches/batch_{args.batch}.txt")
+    if args.delta_cache:
+        hashes = read_genome_manifest_column(args.genome_manifest, "hash")
+    else:
+        hashes = None
 
-    batchwise_containment(fastafiles, pairs, args.containment_output, args.identity_threshold)
+    with scratch_directory(f"pairwise_seq_containment_{args.batch}", args.scratch_dir, args.keep_scratch) as scratch:
+        batchwise_containment(fastafiles, pairs, args.containment_output, args.identity_threshold, args.one_vs_many, args.threads, hashes, args.delta_cache, args.engine, scratch, args.keep_scratch)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Calculate containment index for genome sequences.')
 
-    parser.add_argument("--genomes_list", required=True, help="Text file with list of all fasta filepaths")
+    parser.add_argument("--genome_manifest", required=True, help="Genome manifest with the fasta filepaths of all genomes")
     parser.add_argument("--batch", required=True, help="Batch number")
     parser.add_argument("--identity_threshold", required=True, type=float, help="Identity threshold for comparison")
     parser.add_argument("--outputpath", required=True, help="Path for general output directory")
     parser.add_argument("--containment_output", required=True, help="Output path for containment index results")
+    parser.add_argument("--one_vs_many", action="store_true", help="Align every reference genome of the batch once against all its partners, rather than every pair separately")
+    parser.add_argument("--threads", type=int, default=1, help="Number of pairs to process concurrently")
+    parser.add_argument("--delta_cache", help="Directory of cached filtered alignments, keyed by the contents of both fastas and the alignment parameters")
+    parser.add_argument("--scratch_dir", help="Directory to create the job's scratch directory for intermediate files in, default is /dev/shm if available")
+    parser.add_argument("--keep_scratch", action="store_true", help="Don't remove the scratch directory after the job, e.g. to inspect the files of a failed pair")
+    parser.add_argument("--engine", choices=["nucmer", "minimap2"], default="nucmer", help="Aligner to find the covered intervals with: nucmer, or minimap2 in process through mappy, which always aligns each reference genome once against all its partners")
 
     args = parser.parse_args()
     main(args)
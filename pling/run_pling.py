@@ -12,6 +12,7 @@ import pandas as pd
 from pathlib import Path
 import subprocess
 import yaml
+from pling.utils import get_fasta_file_info, read_in_manifest_genomes
 
 def get_version():
     try:
@@ -34,19 +35,30 @@ def parse_args():
     parser.add_argument("--containment_distance", default=0.5, help="Threshold for initial containment network.")
     parser.add_argument("--dcj", default=4, help="Threshold for final DCJ-Indel network.")
     parser.add_argument("--batch_size", default = 50, help="How many pairs of genomes to run together in one go (for integerisation from alignment and DCJ calculation steps).")
+    parser.add_argument("--batching", choices=["size", "cost", "tiled"], default="size",
+                        help="How to cut pairs into batches: \"size\" puts --batch_size pairs in every batch, \"cost\" makes about as many batches but balances them by predicted runtime, estimated from plasmid lengths (and sourmash similarity if --sourmash is used), "
+                             "\"tiled\" fills batches with square blocks of pairs so that each batch involves as few different plasmids as possible.")
     parser.add_argument("--sourmash", action="store_true", help="Run sourmash as first filter on which pairs to calculate DCJ on. Recommended for large and very diverse datasets.")
     parser.add_argument("--sourmash_threshold", default=0.85, help="Threshold for filtering with sourmash.")
+    parser.add_argument("--sketch_cache", help="Directory in which to cache sourmash sketches, so that they can be reused by later runs on the same or overlapping datasets. Default is output_dir/sourmash/sketch_cache.")
+    parser.add_argument("--collapse_duplicates", action="store_true", help="Collapse identical plasmids, including rotated and reverse complemented copies, to one representative before calculating distances. Distances of representatives are then copied to all their duplicates, which are at distance 0 from each other.")
     parser.add_argument("--identity", default=80, help="Threshold for percentage of shared sequence between blocks (for integerisation from alignment and for containment calculation).")
+    parser.add_argument("--containment_engine", choices=["nucmer", "minimap2"], default="nucmer", help="Aligner for the containment distances (for integerisation from annotation). minimap2 runs in process through mappy and is much faster on large datasets, but its distances are not identical to nucmer's.")
     parser.add_argument("--min_indel_size", default=200, help="Minimum size for an indel to be treated as a block (for integerisation from alignment).")
+    parser.add_argument("--delta_cache", help="Directory in which to cache the alignments of plasmid pairs, keyed by the contents of both fastas and the alignment parameters, so that later runs, e.g. with different thresholds, can skip aligning pairs they have seen before.")
+    parser.add_argument("--one_vs_many", action="store_true", help="Align each plasmid once against all the plasmids it is paired with in a batch, rather than aligning every pair separately. Works best with --batching tiled, where batches involve few different plasmids.")
     parser.add_argument("--bh_connectivity", default=10, help="Minimum number of connections a plasmid need to be considered a hub plasmid.")
     parser.add_argument("--bh_neighbours_edge_density", default=0.2, help="Maximum number of edge density between hub plasmid neighbours to label the plasmid as hub.")
     parser.add_argument("--small_subcommunity_size_threshold", default=4, help="Communities with size up to this parameter will be joined to neighbouring larger subcommunities.")
+    parser.add_argument("--skip_hub_dcj", action="store_true", help="Don't calculate DCJ-Indel distances for pairs involving a hub plasmid of the containment network, as hub plasmids are removed before typing. Skipped pairs are listed in dcj_skipped_hub_pairs.tsv.")
     parser.add_argument("--plasmid_metadata", help="Metadata to add beside plasmid ID on the visualisation graph. Must be a tsv with a single column, with data in the same order as in genomes_list.")
     parser.add_argument("--ilp_solver", choices=["GLPK", "gurobi"], default="GLPK",
                         help="ILP solver to use. Default is GLPK, which is slower but is bundled with pling and is free. "
                              "If using gurobi, make sure you have a valid license and gurobi_cl is in your PATH.")
     parser.add_argument("--timelimit", help="Time limit in seconds for ILP solver.")
     parser.add_argument("--resources", help="tsv stating number of threads and memory to use for each rule.")
+    parser.add_argument("--scratch_dir", help="Directory in which alignment and ILP jobs keep their intermediate files. Default is /dev/shm if available, otherwise the system's temporary directory.")
+    parser.add_argument("--keep_scratch", action="store_true", help="Don't delete the intermediate files of alignment and ILP jobs from the scratch directory, e.g. to debug a failed pair.")
     parser.add_argument("--cores", default=1, help="Total number of cores/threads. Put the maximum number of threads you request in the resources tsv here. (This argument is passed on to snakemake's --cores argument.)")
     parser.add_argument("--profile", help="To run on a cluster with corresponding snakemake profile.")
     #parser.add_argument("--storetmp", action="store_true", help="Don't delete intermediate temporary files.")
@@ -54,6 +66,8 @@ def parse_args():
     parser.add_argument("--dedup", action="store_true", help="Whether or not to deduplicate (for integerisation from annotation).")
     parser.add_argument("--dedup_threshold", default=98.5, help="Threshold for separating paralogs in deduplication step (for integerisation from annotation).")
     parser.add_argument("--bakta_db", help="Path to bakta database (required for integerisation from annotation).")
+    parser.add_argument("--previous_output", help="Output directory of a previous pling run on a subset of genomes_list. Only pairs involving new genomes are aligned and DCJ-Indel distances calculated, and the results are merged with the previous ones before clustering. "
+                                                  "Only available for integerisation from alignment, and the parameters the distances depend on must be the same as in the previous run.")
 
     args = parser.parse_args()
     return args
@@ -63,6 +77,57 @@ def get_pling_path():
     plingpath = os.path.realpath(os.path.dirname(__file__))
     return plingpath
 
+PARAMETERS_FILE = "pling_parameters.yaml"
+
+def get_run_parameters(args):
+    #the parameters the distances of a run depend on, which an incremental run has to share with the run it adds to
+    return {"integerisation": str(args.integerisation),
+            "containment_distance": float(args.containment_distance),
+            "dcj": int(args.dcj),
+            "identity": float(args.identity),
+            "min_indel_size": int(args.min_indel_size),
+            "containment_engine": str(args.containment_engine),
+            "sourmash": bool(args.sourmash),
+            "sourmash_threshold": float(args.sourmash_threshold) if args.sourmash else None,
+            "timelimit": float(args.timelimit) if args.timelimit is not None else None}
+
+def write_run_parameters(args):
+    #kept in the output directory, unlike the config file, so that later incremental runs can check them
+    with open(f"{args.output_dir}/{PARAMETERS_FILE}", "w") as f:
+        yaml.dump(get_run_parameters(args), f)
+
+def check_previous_parameters(args):
+    parameters_path = f"{args.previous_output}/{PARAMETERS_FILE}"
+    if not os.path.exists(parameters_path):
+        raise Exception(f"{parameters_path} is missing, so it can't be checked that the previous run used the same parameters!")
+    with open(parameters_path) as f:
+        previous_parameters = yaml.safe_load(f)
+    parameters = get_run_parameters(args)
+    different = [f"{key} ({previous_parameters.get(key)} in the previous run, {value} now)" for key, value in parameters.items() if previous_parameters.get(key) != value]
+    if len(different) > 0:
+        raise Exception(f"The previous run used different parameters, so its distances can't be merged with this run's: {', '.join(different)}")
+
+def check_previous_output(args):
+    if args.integerisation != "align":
+        raise Exception("Incremental runs with --previous_output are only available for integerisation from alignment!")
+    if args.collapse_duplicates:
+        raise Exception("--collapse_duplicates can't be used together with --previous_output!")
+    if args.skip_hub_dcj:
+        #new genomes change which plasmids are hubs, so pairs skipped in the previous run may need their distances after all
+        raise Exception("--skip_hub_dcj can't be used together with --previous_output!")
+    if os.path.realpath(args.previous_output) == os.path.realpath(args.output_dir):
+        raise Exception("--previous_output must be different from the output directory!")
+    check_previous_parameters(args)
+    previous_genomes = read_in_manifest_genomes(f"{args.previous_output}/batches")
+    fastafiles, fastaext, fastapath = get_fasta_file_info(args.genomes_list)
+    missing = [genome for genome in previous_genomes if genome not in fastaext]
+    if len(missing) > 0:
+        raise Exception(f"Genomes from the previous run are missing from {args.genomes_list}: {', '.join(missing)}")
+
+def copy_previous_unimogs(args):
+    #unimogs of previous pairs are kept alongside the new ones, so the output directory has the unimogs of all pairs
+    shutil.copytree(f"{args.previous_output}/unimogs", f"{args.output_dir}/unimogs/previous", dirs_exist_ok=True)
+
 def make_config_file(args):
     #make configfile
     forceall = ""
@@ -93,14 +158,39 @@ def make_config_file(args):
     tmp_dir = output_dir/"tmp_files"
     tmp_dir.mkdir(parents=True, exist_ok=True)
 
+    if args.previous_output!=None:
+        check_previous_output(args)
+        config_dict_previous = {"previous_output": str(args.previous_output)}
+    else:
+        config_dict_previous = {}
+
+    write_run_parameters(args)
+
     configfile = f"{args.output_dir}/tmp_files/config.yaml"
-    config_dict = {"genomes_list": str(args.genomes_list), "output_dir": str(args.output_dir), "integerisation": str(args.integerisation), "bakta_db": str(args.bakta_db), "seq_containment_distance": float(args.containment_distance), "dcj_dist_threshold": int(args.dcj), "prefix": "all_plasmids","communities": f"{args.output_dir}/containment/containment_communities", "identity_threshold": float(args.identity), "length_threshold": int(args.min_indel_size), "bh_connectivity": int(args.bh_connectivity), "bh_neighbours_edge_density": float(args.bh_neighbours_edge_density), "small_subcommunity_size_threshold": int(args.small_subcommunity_size_threshold),"metadata": metadata, "ilp_solver": str(args.ilp_solver), "timelimit": timelimit, "batch_size": int(args.batch_size)}
+    config_dict = {"genomes_list": str(args.genomes_list), "output_dir": str(args.output_dir), "integerisation": str(args.integerisation), "bakta_db": str(args.bakta_db), "seq_containment_distance": float(args.containment_distance), "dcj_dist_threshold": int(args.dcj), "prefix": "all_plasmids","communities": f"{args.output_dir}/containment/containment_communities", "identity_threshold": float(args.identity), "length_threshold": int(args.min_indel_size), "bh_connectivity": int(args.bh_connectivity), "bh_neighbours_edge_density": float(args.bh_neighbours_edge_density), "small_subcommunity_size_threshold": int(args.small_subcommunity_size_threshold),"metadata": metadata, "ilp_solver": str(args.ilp_solver), "timelimit": timelimit, "batch_size": int(args.batch_size), "batching": str(args.batching)}
+    config_dict.update(config_dict_previous)
+    if args.skip_hub_dcj:
+        config_dict["skip_hub_dcj"] = str(args.skip_hub_dcj)
+    if args.collapse_duplicates:
+        config_dict["collapse_duplicates"] = str(args.collapse_duplicates)
+    if args.one_vs_many:
+        config_dict["one_vs_many"] = str(args.one_vs_many)
+    if args.containment_engine != "nucmer":
+        config_dict["containment_engine"] = str(args.containment_engine)
+    if args.delta_cache:
+        config_dict["delta_cache"] = os.path.abspath(args.delta_cache)
+    if args.scratch_dir:
+        config_dict["scratch_dir"] = os.path.abspath(args.scratch_dir)
+    if args.keep_scratch:
+        config_dict["keep_scratch"] = str(args.keep_scratch)
     if args.dedup:
         config_dict["dedup"] = str(args.dedup)
         config_dict["dedup_threshold"] = str(args.dedup_threshold)
     if args.sourmash:
         config_dict["sourmash"] = str(args.sourmash)
         config_dict["sourmash_threshold"] = str(args.sourmash_threshold)
+        if args.sketch_cache:
+            config_dict["sketch_cache"] = str(args.sketch_cache)
     for row in resources.index:
         rule = resources.loc[row, "Rule"]
         threads = resources.loc[row, "Threads"]
@@ -159,6 +249,9 @@ def pling(args):
     else:
         raise Exception(f"\"{args.integerisation}\" is not a valid integerisation method!")
 
+    if args.previous_output!=None:
+        copy_previous_unimogs(args)
+
     #ding and clustering
     try:
         print("Calculating DCJ-Indel distance and clustering...\n")
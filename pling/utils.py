@@ -1,6 +1,17 @@
 from pathlib import Path
+from contextlib import contextmanager
 import os
-import pandas as pd
+import csv
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+
+BATCH_MANIFEST_GENOMES = "genomes.txt"
+BATCH_MANIFEST_PAIRS = "pairs.bin"
+BATCH_MANIFEST_OFFSETS = "offsets.bin"
+GENOME_MANIFEST = "genome_manifest.tsv"
+DEFAULT_SCRATCH_ROOT = "/dev/shm"
 
 def get_pling_root_dir() -> Path:
     return Path(__file__).parent.parent
@@ -10,17 +21,124 @@ def get_number_of_batches(outputpath):
         batch_size, number_of_batches = f.readlines()
     return int(number_of_batches)
 
-def read_in_batch_pairs(filepath):
-    pairs=[]
-    with open(filepath,"r") as f:
-        for line in f:
-            genome1, genome2 = (line.strip("[]\n").split(","))
-            pairs.append([genome1[1:-1], genome2[2:-1]])
-    return pairs
+class BatchManifestWriter:
+    #binary batch manifest: a genome id table, all pairs as int32 indices into it, and an int64 index of where each batch starts in the pair array
+    def __init__(self, manifest_dir, genomes):
+        self.manifest_dir = Path(manifest_dir)
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_dir/BATCH_MANIFEST_GENOMES, "w") as f:
+            f.write("".join([f"{genome}\n" for genome in genomes]))
+        self.pairs_fh = open(self.manifest_dir/BATCH_MANIFEST_PAIRS, "wb")
+        self.offsets = [0]
+
+    def write_batch(self, pairs_i, pairs_j):
+        pairs = np.empty((len(pairs_i), 2), dtype="<i4")
+        pairs[:, 0] = pairs_i
+        pairs[:, 1] = pairs_j
+        self.pairs_fh.write(pairs.tobytes())
+        self.offsets.append(self.offsets[-1]+len(pairs))
+
+    def close(self):
+        self.pairs_fh.close()
+        np.array(self.offsets, dtype="<i8").tofile(self.manifest_dir/BATCH_MANIFEST_OFFSETS)
+        return len(self.offsets)-1
+
+def get_number_of_manifest_batches(manifest_dir):
+    return len(np.fromfile(Path(manifest_dir)/BATCH_MANIFEST_OFFSETS, dtype="<i8"))-1
+
+def read_in_batch_indices(manifest_dir, batch):
+    offsets = np.fromfile(Path(manifest_dir)/BATCH_MANIFEST_OFFSETS, dtype="<i8")
+    start, end = offsets[int(batch)], offsets[int(batch)+1]
+    if start == end:
+        return np.empty((0, 2), dtype="<i4")
+    pairs = np.memmap(Path(manifest_dir)/BATCH_MANIFEST_PAIRS, dtype="<i4", mode="r", offset=int(start)*8, shape=(int(end-start), 2))
+    return np.array(pairs)
+
+def read_in_manifest_genomes(manifest_dir):
+    with open(Path(manifest_dir)/BATCH_MANIFEST_GENOMES) as f:
+        return f.read().splitlines()
+
+def read_in_batch_pairs(manifest_dir, batch):
+    genomes = read_in_manifest_genomes(manifest_dir)
+    return [[genomes[i], genomes[j]] for i, j in read_in_batch_indices(manifest_dir, batch)]
 
 def get_fasta_file_info(genomes_list):
+    import pandas as pd
     FASTAFILES_LIST = [el[0] for el in pd.read_csv(genomes_list, header=None).values]
     FASTAFILES = {os.path.splitext(os.path.basename(el))[0]:el for el in FASTAFILES_LIST}
     FASTAEXT = {os.path.splitext(os.path.basename(el))[0]:os.path.splitext(os.path.basename(el))[1] for el in FASTAFILES_LIST}
     FASTAPATH = os.path.dirname(FASTAFILES_LIST[0])
     return FASTAFILES, FASTAEXT, FASTAPATH
+
+def get_genome_manifest_path(outputpath):
+    return f"{outputpath}/{GENOME_MANIFEST}"
+
+def scan_fasta(fasta):
+    #one buffered pass over the file for its sequence length, sha256 of its contents and number of records
+    hasher = hashlib.sha256()
+    length = 0
+    records = 0
+    with open(fasta, "rb") as f:
+        for line in f:
+            hasher.update(line)
+            if line.startswith(b">"):
+                records += 1
+            else:
+                length += len(line.strip())
+    return length, hasher.hexdigest(), records
+
+def write_genome_manifest(genomes_list, manifest_path):
+    #tsv of name, path, length, content hash and number of records of every genome, in genomes_list order
+    with open(genomes_list) as f:
+        fastafiles = [line.strip() for line in f if line.strip()]
+    with open(manifest_path, "w") as f:
+        f.write("name\tpath\tlength\thash\trecords\n")
+        for fasta in fastafiles:
+            length, hash, records = scan_fasta(fasta)
+            f.write(f"{os.path.splitext(os.path.basename(fasta))[0]}\t{fasta}\t{length}\t{hash}\t{records}\n")
+
+def read_genome_manifest(manifest_path):
+    #pandas is only imported here, as the per-pair jobs read the manifest with read_genome_manifest_column and shouldn't pay for importing it
+    import pandas as pd
+    return pd.read_csv(manifest_path, sep="\t", index_col="name", dtype={"name": str, "path": str, "length": np.int64, "hash": str, "records": np.int64})
+
+def read_genome_manifest_column(manifest_path, column):
+    #one column of the genome manifest as a dict from genome name to its (string) value, in manifest order
+    with open(manifest_path, newline="") as f:
+        return {row["name"]: row[column] for row in csv.DictReader(f, delimiter="\t")}
+
+def get_manifest_fasta_file_info(manifest_path):
+    #same as get_fasta_file_info, from the genome manifest
+    FASTAFILES = read_genome_manifest_column(manifest_path, "path")
+    FASTAEXT = {genome:os.path.splitext(os.path.basename(path))[1] for genome, path in FASTAFILES.items()}
+    FASTAPATH = os.path.dirname(next(iter(FASTAFILES.values())))
+    return FASTAFILES, FASTAEXT, FASTAPATH
+
+def get_scratch_root(scratch_root=None):
+    #memory backed /dev/shm by default, falling back to the system's temporary directory where it isn't available
+    if scratch_root is not None:
+        return scratch_root
+    if os.path.isdir(DEFAULT_SCRATCH_ROOT) and os.access(DEFAULT_SCRATCH_ROOT, os.W_OK):
+        return DEFAULT_SCRATCH_ROOT
+    return tempfile.gettempdir()
+
+@contextmanager
+def scratch_directory(name, scratch_root=None, keep=False):
+    #a fresh directory for a job's or task's intermediate files, removed afterwards (even if the job fails) unless keep is set
+    scratch_root = get_scratch_root(scratch_root)
+    Path(scratch_root).mkdir(parents=True, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=f"pling_{name}_", dir=scratch_root)
+    try:
+        yield path
+    finally:
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def get_scratch_args(config):
+    #command line arguments of the scripts using scratch_directory
+    args = ""
+    if config.get("scratch_dir"):
+        args += f"--scratch_dir {config['scratch_dir']}"
+    if config.get("keep_scratch", False):
+        args += " --keep_scratch"
+    return args.strip()
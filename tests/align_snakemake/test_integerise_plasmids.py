@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]/"pling"/"align_snakemake")) #integerise_plasmids is run as a script, next to matches
+from integerise_plasmids import make_interval_tree_w_dups
+from matches import Match
+
+
+class Test_integerise_plasmids(TestCase):
+    def test_make_interval_tree_w_dups(self):
+        #the last match is a duplicate on the query, lying around block 2 and touching block 1, and copies the id of the block it envelops
+        matches = [Match(1, 1000, 1, 1000, 1), Match(2000, 2500, 1001, 1500, 1), Match(5000, 6000, 999, 1600, -1)]
+        ref_to_block, query_to_block, max_id = make_interval_tree_w_dups(matches, 200)
+        self.assertEqual(max_id, 2)
+        self.assertEqual(list(ref_to_block), [(1, 1000, 1), (2000, 2500, 2), (5000, 6000, -2)])
+        self.assertEqual(list(query_to_block), [(1, 1000, 1), (1001, 1500, 2)])
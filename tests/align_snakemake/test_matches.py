@@ -0,0 +1,93 @@
+import random
+from unittest import TestCase
+from pling.align_snakemake.matches import Match, Matches, Indel, IndelIndex
+
+
+def sorted_by_query(matches):
+    return all(matches[i-1].qstart<=matches[i].qstart and matches[i-1].qend<=matches[i].qend for i in range(1, len(matches)))
+
+
+class Test_matches(TestCase):
+    def test_resolve_overlaps(self):
+        matches = Matches([Match(1, 1000, 1, 1000, 1), Match(950, 2000, 950, 2000, 1), Match(1990, 3000, 1990, 3000, 1)], [])
+        matches.resolve_overlaps(0)
+        self.assertEqual(str(matches), "[(1, 950, 1, 950, 1), (950, 1000, 950, 1000, 1), (950, 1000, 950, 1000, 1), (1000, 1990, 1000, 1990, 1), "
+                                       "(1990, 2000, 1990, 2000, 1), (1990, 2000, 1990, 2000, 1), (2000, 3000, 2000, 3000, 1)]")
+
+    def test_resolve_overlaps_with_containment(self):
+        matches = Matches([Match(1, 1101, 1, 1101, 1), Match(201, 401, 201, 401, 1), Match(1001, 2101, 1001, 2101, 1), Match(2001, 3101, 2001, 3101, 1)], [])
+        matches.resolve_overlaps(0)
+        self.assertEqual(str(matches), "[(1, 201, 1, 201, 1), (201, 401, 201, 401, 1), (201, 401, 201, 401, 1), (401, 1001, 401, 1001, 1), "
+                                       "(1001, 1101, 1001, 1101, 1), (1001, 1101, 1001, 1101, 1), (1101, 2001, 1101, 2001, 1), "
+                                       "(2001, 2101, 2001, 2101, 1), (2001, 2101, 2001, 2101, 1), (2101, 3101, 2101, 3101, 1)]")
+
+    def test_sort(self):
+        matches = Matches([Match(5, 9, 1, 3, 1), Match(1, 8, 1, 2, 1), Match(1, 4, 6, 7, -1), Match(5, 6, 1, 2, 1)], [])
+        matches.sort(True)
+        self.assertEqual(str(matches), "[(1, 4, 6, 7, -1), (1, 8, 1, 2, 1), (5, 6, 1, 2, 1), (5, 9, 1, 3, 1)]")
+        matches.sort(False)
+        self.assertEqual(str(matches), "[(1, 8, 1, 2, 1), (5, 6, 1, 2, 1), (5, 9, 1, 3, 1), (1, 4, 6, 7, -1)]")
+        self.assertEqual(matches.index(Match(5, 9, 1, 3, -1)), 2)
+
+    def test_sorted_by_query_is_kept_up_to_date(self):
+        rng = random.Random(0)
+        def random_match():
+            rstart, qstart = rng.randint(1, 100), rng.randint(1, 100)
+            return Match(rstart, rstart+rng.randint(1, 20), qstart, qstart+rng.randint(1, 20), rng.choice([1, -1]))
+        matches = Matches([random_match() for _ in range(10)], [])
+        matches.sort(False)
+        for _ in range(500):
+            if rng.random()<0.5:
+                matches[rng.randrange(len(matches))] = random_match()
+            else:
+                matches.insert(rng.randint(0, len(matches)), random_match())
+            self.assertEqual(matches.sorted_by_query(), sorted_by_query(matches.list))
+
+    def test_sort_after_changes(self):
+        #sorting again after setting and inserting matches only moves the changed ones, and must give the same list as a stable sort of all of them
+        rng = random.Random(2)
+        def random_match():
+            rstart, qstart = rng.randint(1, 30), rng.randint(1, 30)
+            return Match(rstart, rstart+rng.randint(1, 5), qstart, qstart+rng.randint(1, 5), rng.choice([1, -1]))
+        matches = Matches([random_match() for _ in range(20)], [])
+        expected = list(matches.list)
+        for _ in range(300):
+            action = rng.random()
+            if action<0.4:
+                position = rng.randrange(len(matches))
+                match = random_match()
+                matches[position] = match
+                expected[position] = match
+            elif action<0.8:
+                position = rng.randint(0, len(matches))
+                match = random_match()
+                matches.insert(position, match)
+                expected.insert(position, match)
+            else:
+                ref_bool = rng.choice([True, False])
+                matches.sort(ref_bool)
+                if ref_bool:
+                    expected = sorted(expected, key=lambda match: (match.rstart, match.rend))
+                else:
+                    expected = sorted(expected, key=lambda match: (match.qstart, match.qend))
+            self.assertEqual([str(match) for match in matches.list], [str(match) for match in expected])
+            match = rng.choice(expected)
+            coords = [(other.rstart, other.rend, other.qstart, other.qend) for other in expected]
+            self.assertEqual(matches.index(match), coords.index((match.rstart, match.rend, match.qstart, match.qend)))
+            self.assertEqual(matches[-1], expected[-1])
+        with self.assertRaises(ValueError):
+            matches.index(Match(100, 200, 100, 200, 1))
+
+    def test_indel_index(self):
+        rng = random.Random(1)
+        indels = [Indel(rng.randint(1, 500), rng.randint(1, 500), rng.randint(1, 30), rng.choice(["INS", "DEL"])) for _ in range(200)]
+        index = IndelIndex(indels)
+        for _ in range(200):
+            rstart, qstart = rng.randint(1, 500), rng.randint(1, 500)
+            rend, qend = rstart+rng.randint(0, 100), qstart+rng.randint(0, 100)
+            near = index.near(rstart, rend, qstart, qend)
+            #every indel starting in both ranges is found, in the original order
+            self.assertTrue(set([indel for indel in indels if rstart<=indel.rstart<=rend and qstart<=indel.qstart<=qend]) <= set(near))
+            self.assertEqual(near, [indel for indel in indels if indel in near])
+            for indel in near:
+                self.assertTrue(rstart<=indel.rstart<=rend or qstart<=indel.qstart<=qend)
@@ -0,0 +1,54 @@
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase, skipUnless
+import numpy as np
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]/"pling"/"align_snakemake")) #unimog is run as a script, next to integerise_plasmids
+from unimog import write_map, write_map_npz
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+BATCH_BLOCKS = {"a~b": [("a", 1, 1, 1200), ("a", 3, 1200, 1501), ("b", -1, 1, 1200), ("b", 2, 1200, 3000)],
+                "a~c": [("a", 1, 1, 1501), ("c", -1, 10, 1510)],
+                "b~c": []}
+
+def write_map_with_pandas(mappath, batch_blocks):
+    #the map writer from before the blocks were kept as tuples, with a DataFrame per plasmid as get_blocks made them
+    frames = {}
+    for pair, blocks in batch_blocks.items():
+        data = {"Plasmid":[], "Block_ID":[], "Start":[], "End":[]}
+        for plasmid, block_id, start, end in blocks:
+            data["Plasmid"].append(plasmid)
+            data["Block_ID"].append(block_id)
+            data["Start"].append(start)
+            data["End"].append(end)
+        frames[pair] = pd.concat([pd.DataFrame(data)], ignore_index=True)
+    with open(mappath, 'w') as f:
+        f.write("\tPlasmid\tBlock_ID\tStart\tEnd\n")
+        for key in frames.keys():
+            f.write(f"{key}")
+            blocks = frames[key]
+            for index in blocks.index:
+                f.write(f"\t{blocks.loc[index, 'Plasmid']}\t{blocks.loc[index, 'Block_ID']}\t{blocks.loc[index, 'Start']}\t{blocks.loc[index, 'End']}\n")
+
+
+class Test_unimog(TestCase):
+    @skipUnless(pd, "pandas is not installed")
+    def test_write_map_matches_pandas_writer(self):
+        with tempfile.TemporaryDirectory() as dir:
+            write_map(f"{dir}/map.txt", BATCH_BLOCKS)
+            write_map_with_pandas(f"{dir}/pandas_map.txt", BATCH_BLOCKS)
+            with open(f"{dir}/map.txt", "rb") as f, open(f"{dir}/pandas_map.txt", "rb") as pandas_f:
+                self.assertEqual(f.read(), pandas_f.read())
+
+    def test_write_map_npz(self):
+        with tempfile.TemporaryDirectory() as dir:
+            write_map_npz(f"{dir}/map.npz", BATCH_BLOCKS)
+            with np.load(f"{dir}/map.npz") as npz:
+                columns = [npz[column].tolist() for column in ["pair", "plasmid", "block_id", "start", "end"]]
+        blocks = {}
+        for pair, plasmid, block_id, start, end in zip(*columns):
+            blocks.setdefault(pair, []).append((plasmid, block_id, start, end))
+        self.assertEqual(blocks, {pair: pair_blocks for pair, pair_blocks in BATCH_BLOCKS.items() if pair_blocks})
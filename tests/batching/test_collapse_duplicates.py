@@ -0,0 +1,45 @@
+import tempfile
+from unittest import mock
+from unittest import TestCase
+from pling.batching.collapse_duplicates import get_duplicate_classes, get_composition_key, is_same_plasmid, reverse_complement
+from pling.utils import write_genome_manifest, read_genome_manifest
+
+
+class Test_collapse_duplicates(TestCase):
+    def write_fasta(self, dir, name, *sequences):
+        path = f"{dir}/{name}.fna"
+        with open(path, "w") as f:
+            for index, sequence in enumerate(sequences):
+                f.write(f">{name}_{index}\n{sequence}\n")
+        return path
+
+    def test_is_same_plasmid(self):
+        sequence = "ATGCGTACGTTAGC"
+        self.assertTrue(is_same_plasmid([sequence], [sequence[5:]+sequence[:5]]))
+        self.assertTrue(is_same_plasmid([sequence], [reverse_complement(sequence[3:]+sequence[:3])]))
+        self.assertFalse(is_same_plasmid([sequence], ["ATGCGTACGTTAGG"]))
+        self.assertFalse(is_same_plasmid([sequence, "AC"], ["AC", sequence]))
+
+    def test_get_composition_key(self):
+        sequence = "ATGCGTACGTTAGCAA"
+        self.assertEqual(get_composition_key([sequence]), get_composition_key([reverse_complement(sequence[3:]+sequence[:3])]))
+        self.assertNotEqual(get_composition_key([sequence]), get_composition_key(["ATGCGTACGTTAGCAC"]))
+        self.assertNotEqual(get_composition_key([sequence[:5], sequence[5:]]), get_composition_key([sequence[5:], sequence[:5]]))
+
+    def test_get_duplicate_classes(self):
+        sequence = "ATGCGTACGTTAGCATTGCA"
+        with tempfile.TemporaryDirectory() as dir:
+            fastafiles = {"a": self.write_fasta(dir, "a", sequence),
+                          "b": self.write_fasta(dir, "b", "TTTTGCGCGCATATATGCGC"),
+                          "c": self.write_fasta(dir, "c", reverse_complement(sequence[7:]+sequence[:7]).lower()),
+                          "d": self.write_fasta(dir, "d", sequence[:10], sequence[10:]),
+                          "e": self.write_fasta(dir, "e", sequence[:10], sequence[10:]),
+                          "f": self.write_fasta(dir, "f", sequence[1:]+"G")}
+            with open(f"{dir}/genomes_list.txt", "w") as f:
+                f.write("".join([f"{fastafiles[genome]}\n" for genome in ["a", "b", "c", "d", "e", "f"]]))
+            write_genome_manifest(f"{dir}/genomes_list.txt", f"{dir}/genome_manifest.tsv")
+            with mock.patch("pling.batching.collapse_duplicates.is_same_plasmid", wraps=is_same_plasmid) as compare:
+                representative = get_duplicate_classes(read_genome_manifest(f"{dir}/genome_manifest.tsv"))
+        self.assertEqual(representative, {"a": "a", "b": "b", "c": "a", "d": "d", "e": "d", "f": "f"})
+        #b and f have the length of a, but not its base composition, so are never compared with it
+        self.assertEqual(compare.call_count, 2)
@@ -0,0 +1,109 @@
+import tempfile
+import shutil
+import numpy as np
+from unittest import TestCase, skipUnless
+from pling.batching.get_batches import BatchWriter, get_pair_rows, get_filtered_rows, get_tiles, get_row_costs, get_target_cost, sketch_genomes, ContainmentIndex
+from pling.utils import read_in_batch_pairs, scan_fasta
+
+try:
+    import sourmash
+    import screed
+except ImportError:
+    sourmash = None
+
+
+class Test_get_batches(TestCase):
+    def setUp(self):
+        self.genomes = ["a", "b", "c", "d"]
+        sketches = [list(range(10)),
+                    list(range(9))+[100],
+                    [0]+list(range(200, 209)),
+                    list(range(5))+[100, 300, 301, 302, 303],
+                    [400]]
+        self.containment_index = ContainmentIndex([np.array(sketch, dtype=np.uint64) for sketch in sketches])
+
+    def test_get_pair_rows_without_sourmash(self):
+        pairs = [(i, j) for i, js, distances in get_pair_rows(len(self.genomes)) for j in js]
+        self.assertEqual(pairs, [(1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (3, 2)])
+
+    def test_get_pair_rows_with_sourmash(self):
+        pairs = []
+        not_pairs = []
+        for i, js, distances, not_js, not_distances in get_filtered_rows(get_pair_rows(len(self.genomes), self.containment_index), 0.6):
+            pairs.extend((i, j, round(distance, 2)) for j, distance in zip(js, distances))
+            not_pairs.extend((i, j, round(distance, 2)) for j, distance in zip(not_js, not_distances))
+        self.assertEqual(pairs, [(1, 0, 0.1), (3, 0, 0.5), (3, 1, 0.4)])
+        self.assertEqual(not_pairs, [(2, 0, 0.9), (2, 1, 0.9), (3, 2, 0.9)])
+
+    def test_get_pair_rows_pairs_sharing_no_hashes(self):
+        rows = {i: (list(js), [round(distance, 2) for distance in distances]) for i, js, distances in get_pair_rows(5, self.containment_index)}
+        self.assertEqual(rows[3], ([0, 1, 2], [0.5, 0.4, 0.9]))
+        self.assertEqual(rows[4], ([0, 1, 2, 3], [1.0, 1.0, 1.0, 1.0]))
+        #they are written to the containment table at distance 1, like any other pair filtered out by sourmash
+        not_pairs = [(i, list(not_js)) for i, js, distances, not_js, not_distances in get_filtered_rows(get_pair_rows(5, self.containment_index), 0.6)]
+        self.assertEqual(not_pairs[-1], (4, [0, 1, 2, 3]))
+
+    def test_batch_writer(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            writer = BatchWriter(output_dir, self.genomes, 4)
+            for i, js, distances in get_pair_rows(len(self.genomes)):
+                writer.add(i, js)
+            self.assertEqual(writer.close(), 2)
+            self.assertEqual(read_in_batch_pairs(output_dir, "0"), [["b", "a"], ["c", "a"], ["c", "b"], ["d", "a"]])
+            self.assertEqual(read_in_batch_pairs(output_dir, "1"), [["d", "b"], ["d", "c"]])
+
+    def test_batch_writer_without_pairs(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            writer = BatchWriter(output_dir, self.genomes[:1], 4)
+            for i, js, distances in get_pair_rows(1):
+                writer.add(i, js)
+            self.assertEqual(writer.close(), 0)
+
+    def test_batch_writer_balances_predicted_cost(self):
+        lengths = np.array([300000.0, 300000.0, 5000.0, 5000.0])
+        target_cost = get_target_cost(lengths, len(self.genomes), 3)
+        with tempfile.TemporaryDirectory() as output_dir:
+            writer = BatchWriter(output_dir, self.genomes, 3, target_cost)
+            for i, js, distances in get_pair_rows(len(self.genomes)):
+                writer.add(i, js, get_row_costs(lengths, i, js, distances))
+            self.assertEqual(writer.close(), 2)
+            self.assertEqual(writer.batch_sizes, [1, 5])
+            self.assertEqual(read_in_batch_pairs(output_dir, "0"), [["b", "a"]])
+            self.assertAlmostEqual(sum(writer.batch_costs), get_target_cost(lengths, len(self.genomes), 6))
+
+    def test_get_tiles(self):
+        tiles = [[(i, list(js)) for i, js, distances in tile] for tile in get_tiles(5, 2)]
+        self.assertEqual(tiles, [[(1, [0])],
+                                 [(2, [0, 1]), (3, [0, 1])],
+                                 [(3, [2])],
+                                 [(4, [0, 1])],
+                                 [(4, [2, 3])],
+                                 []])
+
+    def test_get_tiles_covers_every_pair_once(self):
+        pairs = [(i, j) for tile in get_tiles(23, 4) for i, js, distances in tile for j in js]
+        self.assertEqual(sorted(pairs), [(i, j) for i, js, distances in get_pair_rows(23) for j in js])
+        pairs = [(i, j) for tile in get_tiles(5, 2, self.containment_index) for i, js, distances in tile for j in js]
+        self.assertEqual(sorted(pairs), [(i, j) for i, js, distances in get_pair_rows(5, self.containment_index) for j in js])
+
+    @skipUnless(sourmash, "sourmash is not installed")
+    def test_sketch_cache(self):
+        fastas = ["tests/unimog_tests/test_cases/toy_tests/input/fastas/reference.fna", "tests/unimog_tests/test_cases/toy_tests/input/fastas/reverse.fna"]
+        with tempfile.TemporaryDirectory() as output_dir:
+            sketch_paths = sketch_genomes(fastas, [scan_fasta(fasta)[1] for fasta in fastas], f"{output_dir}/cache", threads=2)
+            self.assertEqual(len(set(sketch_paths)), 2)
+            self.assertTrue(all(sketch_path.exists() for sketch_path in sketch_paths))
+            #a copy of a sketched file under another name is found in the cache, and cached sketches are not rewritten
+            shutil.copy(fastas[0], f"{output_dir}/copy.fna")
+            mtimes = [sketch_path.stat().st_mtime_ns for sketch_path in sketch_paths]
+            copies = [f"{output_dir}/copy.fna", fastas[1]]
+            cached_paths = sketch_genomes(copies, [scan_fasta(fasta)[1] for fasta in copies], f"{output_dir}/cache", threads=2)
+            self.assertEqual(cached_paths, sketch_paths)
+            self.assertEqual([sketch_path.stat().st_mtime_ns for sketch_path in cached_paths], mtimes)
+
+    def test_get_pair_rows_only_new_pairs(self):
+        is_new = np.array([False, True, False, True])
+        pairs = [(i, j) for i, js, distances in get_pair_rows(len(self.genomes), is_new=is_new) for j in js]
+        self.assertEqual(pairs, [(1, 0), (2, 1), (3, 0), (3, 1), (3, 2)])
+        pairs = [(i, j) for tile in get_tiles(len(self.genomes), 2, is_new=is_new) for i, js, distances in tile for j in js]
+        self.assertEqual(sorted(pairs), [(1, 0), (2, 1), (3, 0), (3, 1), (3, 2)])
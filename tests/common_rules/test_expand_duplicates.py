@@ -0,0 +1,19 @@
+import tempfile
+from unittest import TestCase
+from pling.common_rules.expand_duplicates import get_members, expand_distances
+
+
+class Test_expand_duplicates(TestCase):
+    def test_expand_distances(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/classes.tsv", "w") as f:
+                f.write("plasmid\trepresentative\na\ta\nb\tb\nc\ta\nd\td\ne\ta\n")
+            with open(f"{dir}/distances.tsv", "w") as f:
+                f.write("plasmid_1\tplasmid_2\tdistance\nb\ta\t2\nd\tb\t5\n")
+            expand_distances(f"{dir}/distances.tsv", get_members(f"{dir}/classes.tsv"), f"{dir}/expanded.tsv")
+            with open(f"{dir}/expanded.tsv") as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines, ["plasmid_1\tplasmid_2\tdistance",
+                                 "b\ta\t2", "b\tc\t2", "b\te\t2",
+                                 "d\tb\t5",
+                                 "a\tc\t0", "a\te\t0", "c\te\t0"])
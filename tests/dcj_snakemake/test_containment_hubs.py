@@ -0,0 +1,21 @@
+import tempfile
+from unittest import TestCase
+from pling.dcj_snakemake.containment_hubs import get_containment_graph, get_hub_plasmids
+
+
+class Test_containment_hubs(TestCase):
+    def test_get_hub_plasmids(self):
+        #h is a hub straight away, n only once h is removed, and the too distant pair n~s is not an edge
+        pairs = [("h", "n", 0.1), ("h", "p", 0.1), ("h", "q", 0.1), ("h", "s", 0.2), ("h", "t", 0.2),
+                 ("n", "p", 0.3), ("n", "q", 0.3), ("n", "r", 0.3), ("n", "s", 0.9), ("a", "b", 0)]
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/containment.tsv", "w") as f:
+                f.write("plasmid_1\tplasmid_2\tdistance\n")
+                f.write("".join([f"{plasmid_1}\t{plasmid_2}\t{distance}\n" for plasmid_1, plasmid_2, distance in pairs]))
+            graph = get_containment_graph(f"{dir}/containment.tsv", 0.5)
+        self.assertEqual(graph["n"], {"h", "p", "q", "r"})
+        self.assertEqual(get_hub_plasmids(graph, 3, 0.2), {"h", "n"})
+
+    def test_get_hub_plasmids_dense_neighbours(self):
+        graph = {"a": {"b", "c", "d"}, "b": {"a", "c", "d"}, "c": {"a", "b", "d"}, "d": {"a", "b", "c"}}
+        self.assertEqual(get_hub_plasmids(graph, 3, 0.2), set())
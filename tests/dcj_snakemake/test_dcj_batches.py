@@ -0,0 +1,22 @@
+import tempfile
+from unittest import TestCase
+from pling.dcj_snakemake.dcj_batches import read_in_unimog_entries, balance_batches
+
+
+class Test_dcj_batches(TestCase):
+    def test_read_in_unimog_entries(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/batch.unimog", "w") as f:
+                f.write(">a~b:a\n1 2 3 )\n>a~b:b\n1 -2 )\n>a~c:a\n4 5 )\n")
+            unimogs, sizes = read_in_unimog_entries(f"{dir}/batch.unimog", {"a~b:a", "a~b:b"})
+        self.assertEqual(unimogs, {"a~b:a": ">a~b:a\n1 2 3 )\n", "a~b:b": ">a~b:b\n1 -2 )\n"})
+        self.assertEqual(sizes, {"a~b:a": 3, "a~b:b": 2})
+
+    def test_balance_batches(self):
+        batches = balance_batches([10, 1, 7, 3, 2, 6], 2)
+        self.assertEqual(sorted(index for batch in batches for index in batch), list(range(6)))
+        loads = [sum([10, 1, 7, 3, 2, 6][index] for index in batch) for batch in batches]
+        self.assertEqual(sorted(loads), [14, 15])
+
+    def test_balance_batches_no_pairs(self):
+        self.assertEqual(balance_batches([], 0), [])
@@ -0,0 +1,16 @@
+import tempfile
+from unittest import TestCase
+from pling.dcj_snakemake.shared_functions import get_hub_plasmids, touches_hub
+
+
+class Test_shared_functions(TestCase):
+    def test_touches_hub(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/hub_plasmids.csv", "w") as f:
+                f.write("hub_plasmids\nhub_1\nhub_2\n")
+            hub_plasmids = get_hub_plasmids(f"{dir}/hub_plasmids.csv")
+        self.assertEqual(hub_plasmids, {"hub_1", "hub_2"})
+        self.assertTrue(touches_hub(hub_plasmids, "a", "hub_2"))
+        self.assertTrue(touches_hub(hub_plasmids, "hub_1", "a"))
+        self.assertFalse(touches_hub(hub_plasmids, "a", "b"))
+        self.assertFalse(touches_hub(None, "hub_1", "b"))
@@ -0,0 +1,29 @@
+import tempfile
+from unittest import TestCase
+from pling.dcj_snakemake.typing_distances import write_typing_distances
+
+
+class Test_typing_distances(TestCase):
+    def write_inputs(self, dir):
+        with open(f"{dir}/distances.tsv", "w") as f:
+            f.write("plasmid_1\tplasmid_2\tdistance\na\tb\t2\n")
+        with open(f"{dir}/hub_pairs.tsv", "w") as f:
+            f.write("plasmid_1\tplasmid_2\nh\ta\nb\th\n")
+
+    def test_write_typing_distances(self):
+        with tempfile.TemporaryDirectory() as dir:
+            self.write_inputs(dir)
+            write_typing_distances(f"{dir}/distances.tsv", f"{dir}/hub_pairs.tsv", 4, None, f"{dir}/typing.tsv")
+            with open(f"{dir}/typing.tsv") as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines, ["plasmid_1\tplasmid_2\tdistance", "a\tb\t2", "h\ta\t4", "b\th\t4"])
+
+    def test_write_typing_distances_duplicates(self):
+        with tempfile.TemporaryDirectory() as dir:
+            self.write_inputs(dir)
+            with open(f"{dir}/classes.tsv", "w") as f:
+                f.write("plasmid\trepresentative\na\ta\nb\tb\nh\th\nc\th\n")
+            write_typing_distances(f"{dir}/distances.tsv", f"{dir}/hub_pairs.tsv", 4, f"{dir}/classes.tsv", f"{dir}/typing.tsv")
+            with open(f"{dir}/typing.tsv") as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines, ["plasmid_1\tplasmid_2\tdistance", "a\tb\t2", "h\ta\t4", "c\ta\t4", "b\th\t4", "b\tc\t4"])
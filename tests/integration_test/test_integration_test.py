@@ -39,6 +39,16 @@ class Test_Pling_end_to_end(TestCase):
             resources=None,
             profile=None,
             batch_size=50,
+            batching="size",
+            sketch_cache=None,
+            previous_output=None,
+            collapse_duplicates=False,
+            skip_hub_dcj=False,
+            one_vs_many=False,
+            delta_cache=None,
+            containment_engine="nucmer",
+            scratch_dir=None,
+            keep_scratch=False,
             sourmash=False,
             sourmash_threshold=0.85,
         )
@@ -74,6 +84,16 @@ class Test_Pling_end_to_end(TestCase):
             resources=None,
             profile=None,
             batch_size=50,
+            batching="size",
+            sketch_cache=None,
+            previous_output=None,
+            collapse_duplicates=False,
+            skip_hub_dcj=False,
+            one_vs_many=False,
+            delta_cache=None,
+            containment_engine="nucmer",
+            scratch_dir=None,
+            keep_scratch=False,
             sourmash=False,
             sourmash_threshold=0.85,
         )
@@ -108,6 +128,16 @@ class Test_Pling_end_to_end(TestCase):
             resources=None,
             profile=None,
             batch_size=50,
+            batching="size",
+            sketch_cache=None,
+            previous_output=None,
+            collapse_duplicates=False,
+            skip_hub_dcj=False,
+            one_vs_many=False,
+            delta_cache=None,
+            containment_engine="nucmer",
+            scratch_dir=None,
+            keep_scratch=False,
             sourmash=False,
             sourmash_threshold=0.85,
         )
@@ -0,0 +1,67 @@
+import tempfile
+from collections import namedtuple
+from glob import glob
+from pathlib import Path
+from unittest import TestCase, skipUnless
+from pling.jac_network_snakemake.seq_containment import get_mappy_segments, batchwise_containment
+
+try:
+    import mappy
+except ImportError:
+    mappy = None
+
+Hit = namedtuple("Hit", ["r_st", "q_st", "q_en", "strand", "cs"])
+
+CONTAINMENT_TEST_CASES = "tests/jac_network_snakemake/containment_test_cases"
+FASTA_DIRS = ["tests/integration_test/data", "tests/unimog_tests/test_cases/toy_tests/input/fastas", "tests/unimog_tests/test_cases/indel_tests/input/fastas"]
+#how far the minimap2 engine's distance may be from nucmer's, and for the pairs where they are known to diverge further, why (see the README of the test cases)
+MAPPY_TOLERANCE = 0.05
+MAPPY_DIVERGENT_PAIRS = {("LR890289.1", "NZ_CP013657.1"): 0.11, #minimap2 aligns query regions to other copies of repeats, losing flanks that nucmer aligns
+                         ("CP056587.1", "NZ_CP072977.1"): 0.07, #a reference IS copy covers every query copy, where nucmer's 1-to-1 filter lets it cover one
+                         ("del_rearrange", "reference_2"): 0.08, #minimap2 drops alignments mostly overlapping a longer one on the query
+                         ("del_rearrange", "inversion"): 0.08,
+                         ("del_rearrange", "inverse_block"): 0.08,
+                         ("del_rearrange", "dup_and_inverse"): 0.08,
+                         ("dup_and_inverse", "inversion"): 0.08}
+
+
+class Test_seq_containment(TestCase):
+    def test_get_mappy_segments(self):
+        #a 100bp deletion splits the alignment, the 2bp insertion doesn't
+        hit = Hit(r_st=10, q_st=0, q_en=400, strand=1, cs=":100*ac:97+gg:100-"+"a"*100+":100")
+        self.assertEqual(get_mappy_segments(hit, 50), [(10, 308, 0, 300, 100*297/300), (408, 508, 300, 400, 100.0)])
+
+    def test_get_mappy_segments_reverse_strand(self):
+        hit = Hit(r_st=0, q_st=50, q_en=350, strand=-1, cs=":100+"+"c"*100+":100")
+        self.assertEqual(get_mappy_segments(hit, 50), [(0, 100, 250, 350, 100.0), (100, 200, 50, 150, 100.0)])
+
+    @skipUnless(mappy, "mappy is not installed")
+    def test_minimap2_engine(self):
+        data = "tests/integration_test/data"
+        fastafiles = {genome: f"{data}/{genome}.fna" for genome in ["CP057418.1", "NZ_LR882977.1", "NZ_MF510423.1"]}
+        pairs = [("CP057418.1", "NZ_LR882977.1"), ("CP057418.1", "NZ_MF510423.1"), ("NZ_LR882977.1", "NZ_LR882977.1")]
+        with tempfile.TemporaryDirectory() as dir:
+            batchwise_containment(fastafiles, pairs, f"{dir}/containment.tsv", 80, threads=2, engine="minimap2")
+            with open(f"{dir}/containment.tsv") as f:
+                distances = [float(line.split("\t")[2]) for line in f]
+        self.assertLess(distances[0], 0.5)
+        self.assertGreater(distances[1], 0.9)
+        self.assertAlmostEqual(distances[2], 0)
+
+    @skipUnless(mappy, "mappy is not installed")
+    def test_minimap2_engine_matches_nucmer(self):
+        fastafiles = {Path(fasta).stem: fasta for dir in FASTA_DIRS for fasta in glob(f"{dir}/*.fna")}
+        with open(f"{CONTAINMENT_TEST_CASES}/nucmer_distances.tsv") as f:
+            nucmer_distances = {(genome_1, genome_2): float(distance) for genome_1, genome_2, distance in [line.rstrip("\n").split("\t") for line in f]}
+        pairs = list(nucmer_distances)
+        with tempfile.TemporaryDirectory() as dir:
+            batchwise_containment(fastafiles, pairs, f"{dir}/containment.tsv", 80, threads=2, engine="minimap2")
+            with open(f"{dir}/containment.tsv") as f:
+                distances = [float(line.split("\t")[2]) for line in f]
+        differences = []
+        for pair, distance in zip(pairs, distances):
+            differences.append(abs(distance-nucmer_distances[pair]))
+            with self.subTest(pair=pair):
+                self.assertLessEqual(differences[-1], MAPPY_DIVERGENT_PAIRS.get(pair, MAPPY_TOLERANCE))
+        self.assertEqual(len(differences), len(nucmer_distances))
+        self.assertLessEqual(sorted(differences)[len(differences)//2], 0.01)
@@ -0,0 +1,184 @@
+import os
+import gzip
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+from unittest import TestCase, mock
+from pling.alignment import group_pairs_by_reference, write_queries_fasta, split_delta, map_pairs_in_order, copy_delta, get_record_names, \
+    get_delta_cache_path, store_cached_delta, align_pair, read_delta, read_alignments, get_coords, get_indel_positions
+
+
+class Test_alignment(TestCase):
+    def test_group_pairs_by_reference(self):
+        groups = group_pairs_by_reference([("a", "b"), ("c", "b"), ("a", "c")])
+        self.assertEqual(groups, {"a": [(0, "b"), (2, "c")], "c": [(1, "b")]})
+
+    def test_write_queries_fasta(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/b.fna", "w") as f:
+                f.write(">b_1 plasmid\nACGT\n>b_2\nTT")
+            with open(f"{dir}/c.fna", "w") as f:
+                f.write(">c\nGG\n")
+            write_queries_fasta({"b": f"{dir}/b.fna", "c": f"{dir}/c.fna"}, ["b", "c"], f"{dir}/queries.fna")
+            with open(f"{dir}/queries.fna") as f:
+                self.assertEqual(f.read(), ">b~0\nACGT\n>b~1\nTT\n>c~0\nGG\n")
+
+    def test_split_delta(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/a~queries.delta", "w") as f:
+                f.write("/a.fna a~queries.queries.fna\nNUCMER\n"
+                        ">a b~0 100 90\n1 50 1 50 0 0 0\n0\n"
+                        ">a c~0 100 80\n10 60 20 70 1 1 0\n5\n0\n")
+            split_delta(f"{dir}/a~queries.delta", {"b": f"{dir}/a~b", "c": f"{dir}/a~c", "d": f"{dir}/a~d"})
+            with open(f"{dir}/a~b.delta") as f:
+                self.assertEqual(f.read(), "/a.fna a~queries.queries.fna\nNUCMER\n>a b~0 100 90\n1 50 1 50 0 0 0\n0\n")
+            with open(f"{dir}/a~c.delta") as f:
+                self.assertEqual(f.read(), "/a.fna a~queries.queries.fna\nNUCMER\n>a c~0 100 80\n10 60 20 70 1 1 0\n5\n0\n")
+            with open(f"{dir}/a~d.delta") as f:
+                self.assertEqual(f.read(), "/a.fna a~queries.queries.fna\nNUCMER\n")
+
+    def test_copy_delta(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/c.fna", "w") as f:
+                f.write(">c_1 plasmid\nACGT\n>c_2\nTT\n")
+            with open(f"{dir}/a~c.split.1delta", "w") as f:
+                f.write("/a.fna a~queries.queries.fna\nNUCMER\n>a c~1 100 2\n1 2 1 2 0 0 0\n0\n")
+            with open(f"{dir}/a~c.split.1delta") as f, open(f"{dir}/a~c.1delta", "w") as out:
+                copy_delta(f, out, "/a.fna", f"{dir}/c.fna", get_record_names(f"{dir}/c.fna"))
+            with open(f"{dir}/a~c.1delta") as f:
+                self.assertEqual(f.read(), f"/a.fna {dir}/c.fna\nNUCMER\n>a c_2 100 2\n1 2 1 2 0 0 0\n0\n")
+
+    def test_delta_cache(self):
+        with tempfile.TemporaryDirectory() as dir:
+            hashes = {"a": "hash_a", "b": "hash_b"}
+            cache_path = get_delta_cache_path(f"{dir}/cache", "hash_a", "hash_b", "--maxmatch", "4.0.0rc1")
+            self.assertNotEqual(cache_path, get_delta_cache_path(f"{dir}/cache", "hash_b", "hash_a", "--maxmatch", "4.0.0rc1"))
+            self.assertNotEqual(cache_path, get_delta_cache_path(f"{dir}/cache", "hash_a", "hash_b", "--diagdiff 20 --breaklen 500 --maxmatch", "4.0.0rc1"))
+            self.assertNotEqual(cache_path, get_delta_cache_path(f"{dir}/cache", "hash_a", "hash_b", "--maxmatch", "4.0.0"))
+            with open(f"{dir}/old.1delta", "w") as f:
+                f.write("/old/a.fna /old/b.fna\nNUCMER\n>a b 100 90\n1 50 1 50 0 0 0\n0\n")
+            store_cached_delta(f"{dir}/old", cache_path)
+            fastafiles = {"a": "/new/a.fna", "b": "/new/b.fna"}
+            with mock.patch("pling.alignment.get_nucmer_version", return_value="4.0.0rc1"), \
+                 mock.patch("pling.alignment.subprocess.check_call", side_effect=fake_nucmer) as nucmer:
+                #a cache hit doesn't run nucmer, and points the delta at this run's fastas
+                align_pair("a", "b", fastafiles, f"{dir}/new", "--maxmatch", hashes, f"{dir}/cache")
+                self.assertEqual(nucmer.call_count, 0)
+                with open(f"{dir}/new.1delta") as f:
+                    self.assertEqual(f.read(), "/new/a.fna /new/b.fna\nNUCMER\n>a b 100 90\n1 50 1 50 0 0 0\n0\n")
+                #other nucmer options are a cache miss
+                align_pair("a", "b", fastafiles, f"{dir}/other_options", "--maxmatch --breaklen 500", hashes, f"{dir}/cache")
+                self.assertEqual(nucmer.call_count, 1)
+            #as is another MUMmer version
+            with mock.patch("pling.alignment.get_nucmer_version", return_value="4.0.0"), \
+                 mock.patch("pling.alignment.subprocess.check_call", side_effect=fake_nucmer) as nucmer:
+                align_pair("a", "b", fastafiles, f"{dir}/other_version", "--maxmatch", hashes, f"{dir}/cache")
+                self.assertEqual(nucmer.call_count, 1)
+                with open(f"{dir}/other_version.1delta") as f:
+                    self.assertIn("fake", f.read())
+            self.assertEqual(len(list(Path(f"{dir}/cache").rglob("*.1delta.gz"))), 3)
+
+    def test_delta_cache_concurrent_writes(self):
+        #workers storing the same pair at once leave one complete entry behind, and no temporary files
+        with tempfile.TemporaryDirectory() as dir:
+            cache_path = get_delta_cache_path(f"{dir}/cache", "hash_a", "hash_b", "--maxmatch", "4.0.0rc1")
+            deltas = {}
+            for writer in range(8):
+                deltas[writer] = f"/a.fna /b.fna\nNUCMER\n>a b 100000 90000\n" + "".join([f"{i} {i+50} {i} {i+50} {writer} {writer} 0\n0\n" for i in range(1, 20000, 100)])
+                with open(f"{dir}/writer_{writer}.1delta", "w") as f:
+                    f.write(deltas[writer])
+            prefixes = [f"{dir}/writer_{writer}" for writer in deltas]
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(store_cached_delta, prefixes, [cache_path]*len(prefixes)))
+            with ProcessPoolExecutor(max_workers=4) as executor:
+                list(executor.map(store_cached_delta, prefixes, [cache_path]*len(prefixes)))
+            with gzip.open(cache_path, "rt") as f:
+                self.assertIn(f.read(), deltas.values())
+            self.assertEqual(os.listdir(cache_path.parent), [cache_path.name])
+
+    def test_map_pairs_in_order(self):
+        pairs = [("a", "b"), ("c", "b"), ("a", "c"), ("c", "d")]
+        fastafiles = {genome: f"{genome}.fna" for genome in "abcd"}
+        expected = ["a.fna~b.fna:x", "c.fna~b.fna:x", "a.fna~c.fna:x", "c.fna~d.fna:x"]
+        for one_vs_many in [False, True]:
+            for threads in [1, 3]:
+                results = map_pairs_in_order(pair_result, reference_results, pairs, fastafiles, None, ("x",), one_vs_many, threads)
+                self.assertEqual(results, expected)
+
+    def test_read_delta(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/a~b.1delta", "w") as f:
+                f.write("/a.fna /b.fna\nNUCMER\n>a b 100 90\n1 50 1 49 3 3 0\n10\n-5\n1\n0\n60 80 90 69 1 1 0\n-3\n0\n")
+            alignments = list(read_delta(f"{dir}/a~b.1delta"))
+        self.assertEqual([(alignment.sR, alignment.eR, alignment.sQ, alignment.eQ, alignment.errors, alignment.deltas) for alignment in alignments],
+                         [(1, 50, 1, 49, 3, [10, -5, 1]), (60, 80, 90, 69, 1, [-3])])
+        self.assertEqual(get_coords(alignments), [(1, 51, 1, 50, 100, 90, 1), (60, 81, 69, 91, 100, 90, -1)])
+        #94.1% and 95.5% identity, as the gapped query bases count towards the length of the alignment
+        self.assertEqual(get_coords(alignments, 95), [(60, 81, 69, 91, 100, 90, -1)])
+        self.assertEqual(list(get_indel_positions(alignments)), [(10, 9, "DEL"), (14, 14, "INS"), (15, 14, "DEL"), (61, 88, "INS")])
+        coords, gapped, mismatched = read_alignments(iter(alignments), 95)
+        self.assertEqual(coords, [(60, 81, 69, 91, 100, 90, -1)])
+        self.assertEqual(gapped, alignments)
+        self.assertFalse(mismatched)
+
+    def test_against_mummer(self):
+        #real delta-filter -1 output with what show-coords -TrcldH -I 80 and show-snps -TrH print for it, see tests/alignment_test_cases/README.md
+        for case in ["reverse_multi_record", "low_identity", "single_indel_n", "single_indel_substitution"]:
+            with self.subTest(case=case):
+                dir = f"tests/alignment_test_cases/{case}"
+                alignments = list(read_delta(f"{dir}/{case}.1delta"))
+                self.assertEqual(get_coords(alignments, 80), read_show_coords(f"{dir}/{case}.coords"))
+                snps = read_show_snps(f"{dir}/{case}.snps")
+                self.assertEqual(list(get_indel_positions(alignments)), [(rpos, qpos, type) for rpos, qpos, type in snps if type != "SNP"])
+        alignments = list(read_delta("tests/alignment_test_cases/reverse_multi_record/reverse_multi_record.1delta"))
+        self.assertEqual(len([alignment for alignment in alignments if alignment.sQ > alignment.eQ]), 2)
+        self.assertEqual(len({(alignment.reference, alignment.query) for alignment in alignments}), 4)
+
+    def test_mismatched(self):
+        #integerisation only reads a single gapped base as an indel if the alignments have a mismatch as well, as it did with show-snps output
+        dir = "tests/alignment_test_cases/single_indel_substitution"
+        coords, gapped, mismatched = read_alignments(read_delta(f"{dir}/single_indel_substitution.1delta"))
+        self.assertEqual(sum([len(alignment.deltas) for alignment in gapped]), 1)
+        self.assertEqual([type for rpos, qpos, type in read_show_snps(f"{dir}/single_indel_substitution.snps")], ["DEL", "SNP"])
+        self.assertTrue(mismatched)
+        #mismatches against n count too, though show-snps leaves them out
+        dir = "tests/alignment_test_cases/single_indel_n"
+        coords, gapped, mismatched = read_alignments(read_delta(f"{dir}/single_indel_n.1delta"))
+        self.assertEqual(len(read_show_snps(f"{dir}/single_indel_n.snps")), 1)
+        self.assertTrue(mismatched)
+
+
+def read_show_coords(path):
+    #the coordinates integerisation read from show-coords -TrcldH output
+    coords = []
+    with open(path) as f:
+        for line in f:
+            split_line = line.split("\t")
+            start_ref, end_ref = sorted([int(split_line[0]), int(split_line[1])])
+            start_query, end_query = sorted([int(split_line[2]), int(split_line[3])])
+            coords.append((start_ref, end_ref+1, start_query, end_query+1, int(split_line[7]), int(split_line[8]), int(split_line[12])))
+    return coords
+
+def read_show_snps(path):
+    #(rpos, qpos, type) of every line of show-snps -TrH output, with type "INS", "DEL" or "SNP"
+    snps = []
+    with open(path) as f:
+        for line in f:
+            split_line = line.split("\t")
+            type = "INS" if split_line[1] == "." else "DEL" if split_line[2] == "." else "SNP"
+            snps.append((int(split_line[0]), int(split_line[3]), type))
+    return snps
+
+def fake_nucmer(command, shell):
+    #stands in for "nucmer -p {prefix} ... && delta-filter ... > {prefix}.1delta"
+    prefix = command.split(" -p ")[1].split()[0]
+    open(f"{prefix}.delta", "w").close()
+    with open(f"{prefix}.1delta", "w") as f:
+        f.write("/a.fna /b.fna\nNUCMER\n>a fake 100 90\n1 50 1 50 0 0 0\n0\n")
+
+def pair_result(genome_1, genome_2, fastafiles, hashes, suffix):
+    return f"{fastafiles[genome_1]}~{fastafiles[genome_2]}:{suffix}"
+
+def reference_results(genome_1, partners, fastafiles, hashes, suffix):
+    return [pair_result(genome_1, genome_2, fastafiles, hashes, suffix) for genome_2 in partners]
+
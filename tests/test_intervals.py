@@ -0,0 +1,97 @@
+import random
+from unittest import TestCase
+from pling.intervals import get_coverage, get_gaps, IntervalIndex
+
+
+def get_covered_positions(intervals):
+    return {pos for start, end in intervals for pos in range(start, end)}
+
+def get_gaps_per_base(intervals, total_length, length_threshold):
+    #the per-base scan that integerise_plasmids used to find unmatched blocks with
+    covered = get_covered_positions(intervals)
+    gaps = []
+    pos = 1
+    while pos <= total_length:
+        if pos not in covered:
+            start_pos = pos
+            while pos not in covered and pos<=total_length:
+                pos+=1
+            if pos-start_pos > length_threshold:
+                gaps.append((start_pos, pos))
+        else:
+            pos+=1
+    return gaps
+
+
+class Test_intervals(TestCase):
+    def test_get_coverage(self):
+        self.assertEqual(get_coverage([]), 0)
+        self.assertEqual(get_coverage([(1, 5)]), 4)
+        self.assertEqual(get_coverage([(1, 5), (5, 8), (10, 12)]), 9)
+        self.assertEqual(get_coverage([(1, 10), (2, 4), (3, 12), (3, 12)]), 11)
+
+    def test_get_coverage_matches_per_base_count(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            intervals = []
+            for _ in range(rng.randint(1, 50)):
+                start = rng.randint(1, 1000)
+                intervals.append((start, start+rng.randint(1, 200)))
+            self.assertEqual(get_coverage(intervals), len(get_covered_positions(intervals)))
+
+    def test_get_gaps(self):
+        self.assertEqual(get_gaps([], 10), [(1, 11)])
+        self.assertEqual(get_gaps([(1, 11)], 10), [])
+        self.assertEqual(get_gaps([(3, 5), (4, 8), (20, 30)], 25, 1), [(1, 3), (8, 20)])
+        self.assertEqual(get_gaps([(3, 5), (4, 8), (20, 30)], 25, 10), [(8, 20)])
+
+    def test_get_gaps_matches_per_base_scan(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            total_length = rng.randint(1, 1500)
+            intervals = []
+            for _ in range(rng.randint(0, 20)):
+                start = rng.randint(1, 1600)
+                intervals.append((start, start+rng.randint(1, 300)))
+            length_threshold = rng.choice([0, 5, 50])
+            self.assertEqual(get_gaps(intervals, total_length, length_threshold), get_gaps_per_base(intervals, total_length, length_threshold))
+
+    def test_interval_index(self):
+        index = IntervalIndex([(10, 20, "a"), (1, 5, "b"), (15, 30, "c"), (5, 8, "d"), (1, 5, "b")])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.overlap(4, 11), [(1, 5, "b"), (5, 8, "d"), (10, 20, "a")])
+        self.assertEqual(index.envelop(1, 20), [(1, 5, "b"), (5, 8, "d"), (10, 20, "a")])
+        self.assertEqual(index.contain(16, 20), [(10, 20, "a"), (15, 30, "c")])
+        self.assertEqual(index.at(20), [(15, 30, "c")])
+        self.assertEqual(index.overlap(8, 10), [])
+        self.assertEqual(index.contain(5, 5), [])
+        index.remove(10, 20, "a")
+        index.discard(10, 20, "a")
+        self.assertEqual(list(index), [(1, 5, "b"), (5, 8, "d"), (15, 30, "c")])
+        self.assertRaises(ValueError, index.add, 3, 3, "e")
+        self.assertEqual(IntervalIndex().overlap(1, 10), [])
+
+    def test_interval_index_matches_brute_force(self):
+        rng = random.Random(2)
+        for _ in range(100):
+            index = IntervalIndex()
+            intervals = []
+            for _ in range(rng.randint(0, 60)):
+                if intervals and rng.random()<0.3:
+                    interval = rng.choice(intervals)
+                    index.remove(*interval)
+                    intervals.remove(interval)
+                else:
+                    start = rng.randint(0, 500)
+                    interval = (start, start+rng.randint(1, rng.choice([80, 80, 500])), rng.choice([1, -1]))
+                    index.add(*interval)
+                    if interval not in intervals:
+                        intervals.append(interval)
+            self.assertEqual(list(index), sorted(intervals, key=lambda interval: (interval[0], interval[1], intervals.index(interval))))
+            for _ in range(30):
+                start = rng.randint(-10, 600)
+                end = start+rng.randint(1, 100)
+                self.assertEqual(index.overlap(start, end), [interval for interval in index if interval[0]<end and interval[1]>start])
+                self.assertEqual(index.envelop(start, end), [interval for interval in index if start<=interval[0] and interval[1]<=end])
+                self.assertEqual(index.contain(start, end), [interval for interval in index if interval[0]<=start and end<=interval[1]])
+                self.assertEqual(index.at(start), [interval for interval in index if interval[0]<=start<interval[1]])
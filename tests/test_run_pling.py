@@ -0,0 +1,25 @@
+import tempfile
+from argparse import Namespace
+from unittest import TestCase
+from pling.run_pling import write_run_parameters, check_previous_parameters
+
+
+def get_args(output_dir, **changes):
+    args = Namespace(output_dir=output_dir, previous_output=None, integerisation="align", containment_distance=0.5, dcj=4, identity=80,
+                     min_indel_size=200, containment_engine="nucmer", sourmash=False, sourmash_threshold=0.85, timelimit=None)
+    for key, value in changes.items():
+        setattr(args, key, value)
+    return args
+
+
+class Test_run_pling(TestCase):
+    def test_check_previous_parameters(self):
+        with tempfile.TemporaryDirectory() as previous, tempfile.TemporaryDirectory() as output:
+            self.assertRaisesRegex(Exception, "pling_parameters.yaml is missing", check_previous_parameters, get_args(output, previous_output=previous))
+            write_run_parameters(get_args(previous))
+            #the same parameters, given as strings on the command line, and a sourmash threshold that isn't used
+            check_previous_parameters(get_args(output, previous_output=previous, containment_distance="0.5", dcj="4", sourmash_threshold="0.9"))
+            for change in [{"containment_distance": "0.3"}, {"dcj": 5}, {"sourmash": True}, {"containment_engine": "minimap2"}, {"timelimit": "60"}]:
+                with self.subTest(change=change):
+                    with self.assertRaisesRegex(Exception, f"{list(change)[0]} \\(.* in the previous run, .* now\\)"):
+                        check_previous_parameters(get_args(output, previous_output=previous, **change))
@@ -0,0 +1,43 @@
+import os
+import tempfile
+from unittest import TestCase
+from pling.utils import write_genome_manifest, read_genome_manifest, read_genome_manifest_column, get_manifest_fasta_file_info, get_fasta_file_info, scratch_directory, get_scratch_args
+
+
+class Test_utils(TestCase):
+    def test_genome_manifest(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with open(f"{dir}/a.fna", "w") as f:
+                f.write(">a_1 plasmid\nACGTACGT\nACG\n>a_2\nTTTT\n")
+            with open(f"{dir}/b.fasta", "w") as f:
+                f.write(">b\nAC\n")
+            with open(f"{dir}/genomes_list.txt", "w") as f:
+                f.write(f"{dir}/a.fna\n{dir}/b.fasta\n")
+            write_genome_manifest(f"{dir}/genomes_list.txt", f"{dir}/genome_manifest.tsv")
+            manifest = read_genome_manifest(f"{dir}/genome_manifest.tsv")
+            self.assertEqual(list(manifest.index), ["a", "b"])
+            self.assertEqual(list(manifest["length"]), [15, 2])
+            self.assertEqual(list(manifest["records"]), [2, 1])
+            self.assertEqual(manifest["hash"].str.len().tolist(), [64, 64])
+            self.assertEqual(get_manifest_fasta_file_info(f"{dir}/genome_manifest.tsv"), get_fasta_file_info(f"{dir}/genomes_list.txt"))
+            self.assertEqual(read_genome_manifest_column(f"{dir}/genome_manifest.tsv", "hash"), manifest["hash"].to_dict())
+
+    def test_scratch_directory(self):
+        with tempfile.TemporaryDirectory() as dir:
+            with scratch_directory("job", f"{dir}/scratch") as scratch:
+                self.assertTrue(os.path.basename(scratch).startswith("pling_job_"))
+                open(f"{scratch}/a.delta", "w").close()
+            self.assertFalse(os.path.exists(scratch))
+            with self.assertRaises(ValueError):
+                with scratch_directory("failed", dir) as scratch:
+                    raise ValueError
+            self.assertFalse(os.path.exists(scratch))
+            with scratch_directory("kept", dir, keep=True) as scratch:
+                pass
+            self.assertTrue(os.path.exists(scratch))
+
+    def test_get_scratch_args(self):
+        self.assertEqual(get_scratch_args({}), "")
+        self.assertEqual(get_scratch_args({"scratch_dir": "/tmp/scratch"}), "--scratch_dir /tmp/scratch")
+        self.assertEqual(get_scratch_args({"scratch_dir": "/tmp/scratch", "keep_scratch": "True"}), "--scratch_dir /tmp/scratch --keep_scratch")
+        self.assertEqual(get_scratch_args({"keep_scratch": "True"}), "--keep_scratch")
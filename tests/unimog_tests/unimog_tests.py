@@ -74,6 +74,16 @@ def assert_annotation(tests, test_dir, dedup_bool):
                          resources=None,
                          profile=None,
                          batch_size=5,
+                         batching="size",
+                         sketch_cache=None,
+                         previous_output=None,
+                         collapse_duplicates=False,
+                         skip_hub_dcj=False,
+                         one_vs_many=False,
+                         delta_cache=None,
+                         containment_engine="nucmer",
+                         scratch_dir=None,
+                         keep_scratch=False,
                          sourmash=False,
                          sourmash_threshold=None)
         run_pling.pling(args)
@@ -130,6 +140,16 @@ class Test_Pling(TestCase):
                              resources=None,
                              profile=None,
                              batch_size=5,
+                             batching="size",
+                             sketch_cache=None,
+                             previous_output=None,
+                             collapse_duplicates=False,
+                             skip_hub_dcj=False,
+                             one_vs_many=False,
+                             delta_cache=None,
+                             containment_engine="nucmer",
+                             scratch_dir=None,
+                             keep_scratch=False,
                              sourmash=False,
                              sourmash_threshold=None)
             run_pling.pling(args)
@@ -173,6 +193,16 @@ class Test_Pling(TestCase):
                              resources=None,
                              profile=None,
                              batch_size=1,
+                             batching="size",
+                             sketch_cache=None,
+                             previous_output=None,
+                             collapse_duplicates=False,
+                             skip_hub_dcj=False,
+                             one_vs_many=False,
+                             delta_cache=None,
+                             containment_engine="nucmer",
+                             scratch_dir=None,
+                             keep_scratch=False,
                              sourmash=False,
                              sourmash_threshold=None)
             run_pling.pling(args)